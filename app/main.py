@@ -1,25 +1,42 @@
 from fastapi import FastAPI
+import pymongo
 from pymongo import MongoClient
 import os
+import asyncio
 import logging
 import razorpay
 
-from app.services.whatsapp_service import send_list
+from app.services.whatsapp_service import send_list, use_outbox
+from app.services.outbox_service import Outbox, OUTBOX_ENABLED, OUTBOX_DEFER_ON_FAILURE
+from app.services import resilience_service
+from app.services.media_service import init_media, warm_media_cache
+from app.services import traffic_service
+from app.services.analytics_service import init_analytics, start_flusher, stop_flusher
+from app.services.capture_service import flush_capture
+from app.services.profiling_service import init_profiling, start_profile_watcher
+from app.services.offering_service import init_offerings, offerings_enabled, reconcile_forever
+from app.routes.payments import router as payments_router
 from app.routes.webhook import router as webhook_router, init_dependencies
+from app.routes.admin import router as admin_router, init_dependencies as init_admin_dependencies, require_admin
+from app.services.credential_service import hash_key
+from app.services.devotee import ensure_devotee_indexes
+from app.services.coordination import is_multi_worker, acquire_lock, release_lock, ensure_lock_indexes
+from app.services.registration_service import registration_sessions
 
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
-import hashlib
-from datetime import datetime, timedelta
+from datetime import datetime
 
 print("MAIN FILE LOADED")
 
 
 app = FastAPI()
 app.include_router(webhook_router)
+app.include_router(admin_router)
+app.include_router(payments_router)
 
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
@@ -61,6 +78,7 @@ VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")
 WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
 PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 MONGODB_URI = os.getenv("MONGODB_URI")
+MONGODB_DB = os.getenv("MONGODB_DB", "sohum_db")
 
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
@@ -79,9 +97,11 @@ client = MongoClient(
     MONGODB_URI,
     serverSelectionTimeoutMS=5000,
     connectTimeoutMS=5000,
-    socketTimeoutMS=5000
+    socketTimeoutMS=5000,
+    timeoutMS=resilience_service.MONGO_TIMEOUT_MS
 )
-db = client["sohum_db"]
+# Each operation is capped by MONGO_TIMEOUT_MS and the request budget.
+db = resilience_service.BudgetedDatabase(client[MONGODB_DB])
 
 devotees = db["devotees"]
 bookings = db["bookings"]
@@ -91,8 +111,10 @@ admin_users = db["admin_users"]
 admin_sessions = db["admin_sessions"]
 offerings = db["offerings"]
 membership_audit_logs = db["membership_audit_logs"]
+locks = db["locks"]
 
 devotees.create_index("phone", unique=True)
+ensure_devotee_indexes(devotees)
 bookings.create_index("booking_id", unique=True)
 sessions.create_index("phone", unique=True)   # 👈 ADD THIS LINE
 processed_messages.create_index("message_id", unique=True)
@@ -101,11 +123,70 @@ admin_sessions.create_index("phone", unique=True)
 offerings.create_index("offering_id", unique=True)
 offerings.create_index("phone")
 membership_audit_logs.create_index([("phone", 1), ("timestamp", -1)])
+ensure_lock_indexes(locks)
+
+# Durable outbound queue: replies survive Graph API failures and restarts.
+# Without OUTBOX_ENABLED it only carries replies deferred during outages.
+outbox = None
+if OUTBOX_ENABLED or OUTBOX_DEFER_ON_FAILURE:
+    outbox = Outbox(db["outbox"], db["outbox_dead_letters"])
+    outbox.ensure_indexes()
+    use_outbox(outbox, all_messages=OUTBOX_ENABLED)
+
+# Uploaded WhatsApp media ids for static assets (history images).
+init_media(db["media_cache"], locks)
+
+# Pre-aggregated daily usage counters, flushed in batches.
+init_analytics(db["analytics_daily"], db["analytics_active_users"], sessions)
+
+# On-demand profiling runs shared by all workers.
+init_profiling(db["profile_runs"], db["profile_samples"])
+
+# Conversation state must be shared when more than one worker serves traffic.
+if is_multi_worker():
+    registration_sessions.use_collection(db["registration_sessions"])
+    logger.info("Multi-worker mode: registration sessions stored in MongoDB.")
 
 # =====================================================
 # STARTUP VALIDATION
 # =====================================================
 
+async def bootstrap_dev_admin():
+    existing_dev_admin = admin_users.find_one({"phone": DEV_ADMIN_PHONE})
+
+    if existing_dev_admin:
+        # Ensure correct role and active status
+        admin_users.update_one(
+            {"phone": DEV_ADMIN_PHONE},
+            {"$set": {
+                "role": "dev_admin",
+                "active": True
+            }}
+        )
+        logger.info("Dev admin already exists. Role verified.")
+        return
+
+    key_hash = await hash_key(DEV_ADMIN_KEY)
+
+    # Upsert rather than insert so a concurrent bootstrap cannot fail
+    # on the unique phone index.
+    admin_users.update_one(
+        {"phone": DEV_ADMIN_PHONE},
+        {
+            "$set": {"role": "dev_admin", "active": True},
+            "$setOnInsert": {
+                "name": "Dev Admin",
+                "personal_key_hash": key_hash,
+                "key_last_changed": datetime.utcnow(),
+                "created_at": datetime.utcnow(),
+            },
+        },
+        upsert=True
+    )
+
+    logger.info("Dev admin auto-created successfully.")
+
+
 @app.on_event("startup")
 async def startup_checks():
     try:
@@ -116,41 +197,64 @@ async def startup_checks():
         # AUTO-CREATE DEV ADMIN IF NOT EXISTS
         # ------------------------------------------
         if DEV_ADMIN_PHONE and DEV_ADMIN_KEY:
-            existing_dev_admin = admin_users.find_one({
-                "phone": DEV_ADMIN_PHONE,
-                "role": "dev_admin"
-            })
-
-            if not existing_dev_admin:
-                key_hash = hashlib.sha256(DEV_ADMIN_KEY.encode()).hexdigest()
-
-                admin_users.insert_one({
-                    "phone": DEV_ADMIN_PHONE,
-                    "name": "Dev Admin",
-                    "role": "dev_admin",
-                    "personal_key_hash": key_hash,
-                    "key_last_changed": datetime.utcnow(),
-                    "created_at": datetime.utcnow(),
-                    "active": True
-                })
-
-                logger.info("Dev admin auto-created successfully.")
+            # Every worker runs this hook; only the lease holder bootstraps.
+            if acquire_lock(locks, "bootstrap_dev_admin"):
+                try:
+                    await bootstrap_dev_admin()
+                finally:
+                    release_lock(locks, "bootstrap_dev_admin")
             else:
-                # Ensure correct role and active status
-                admin_users.update_one(
-                    {"phone": DEV_ADMIN_PHONE},
-                    {"$set": {
-                        "role": "dev_admin",
-                        "active": True
-                    }}
-                )
-                logger.info("Dev admin already exists. Role verified.")
+                logger.info("Dev admin bootstrap running on another worker.")
         else:
             logger.warning("DEV_ADMIN_PHONE or DEV_ADMIN_KEY not set. Dev admin not auto-created.")
     except Exception as e:
         logger.error(f"MongoDB connection failed during startup: {e}")
         raise
 
+@app.on_event("startup")
+async def start_outbox():
+    if outbox:
+        outbox.start()
+    warm_media_cache()
+
+
+@app.on_event("shutdown")
+async def stop_outbox():
+    if outbox:
+        outbox.stop()
+
+
+@app.on_event("startup")
+async def start_load_monitor():
+    traffic_service.load_monitor.start()
+
+
+@app.on_event("shutdown")
+async def stop_load_monitor():
+    traffic_service.load_monitor.stop()
+
+
+@app.on_event("startup")
+async def start_analytics():
+    start_flusher()
+
+
+@app.on_event("shutdown")
+async def stop_analytics():
+    stop_flusher()
+
+
+@app.on_event("shutdown")
+async def stop_capture():
+    flush_capture()
+
+
+@app.on_event("startup")
+async def start_profiling():
+    if is_multi_worker():
+        start_profile_watcher()
+
+
 # =====================================================
 # RAZORPAY INIT
 # =====================================================
@@ -160,6 +264,15 @@ if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
     razorpay_client = razorpay.Client(
         auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET)
     )
+    init_offerings(razorpay_client, offerings, bookings, db["payment_events"])
+    if not offerings_enabled():
+        logger.warning("Seva offerings disabled: PUBLIC_BASE_URL or the seva catalogue is missing")
+
+
+@app.on_event("startup")
+async def start_reconciler():
+    if offerings_enabled():
+        asyncio.create_task(reconcile_forever(locks))
 
 # =====================================================
 # MENU FUNCTIONS
@@ -176,35 +289,35 @@ def send_language_selection(phone):
     )
 
 
-def send_main_menu(phone):
-    from app.services.session_service import get_language
-    lang = get_language(phone, sessions)
+def send_main_menu(phone, lang=None):
+    """Without `lang`, the menu follows the language stored in the session."""
+    if lang is None:
+        from app.services.session_service import get_language
+        lang = get_language(phone, sessions)
 
     header_en = "🛕 Sri Parvati Jadala Ramalingeshwara Swamy Temple\nCheruvugattu\n\nPlease choose an option:" 
     header_tel = "🛕 శ్రీ పార్వతి జడల రామలింగేశ్వర స్వామి దేవస్థానం\nచెరువుగట్టు\n\nదయచేసి ఒక ఎంపికను ఎంచుకోండి:" 
 
     if lang == "tel":
-        send_list(
-            phone,
-            header_tel,
-            [
-                {"id": "register", "title": "📝 భక్తుడు నమోదు"},
-                {"id": "history", "title": "📜 స్థలపురాణం"},
-                {"id": "next_tithi", "title": "🌕 తదుపరి తిథి"},
-                {"id": "change_lang", "title": "🌐 భాష మార్చండి"}
-            ]
-        )
+        rows = [
+            {"id": "register", "title": "📝 భక్తుడు నమోదు"},
+            {"id": "history", "title": "📜 స్థలపురాణం"},
+            {"id": "next_tithi", "title": "🌕 తదుపరి తిథి"},
+            {"id": "change_lang", "title": "🌐 భాష మార్చండి"}
+        ]
+        if offerings_enabled():
+            rows.insert(3, {"id": "offerings", "title": "🙏 సేవ బుకింగ్"})
+        send_list(phone, header_tel, rows)
     else:
-        send_list(
-            phone,
-            header_en,
-            [
-                {"id": "register", "title": "📝 Register Devotee"},
-                {"id": "history", "title": "📜 History"},
-                {"id": "next_tithi", "title": "🌕 Know Next Tithi"},
-                {"id": "change_lang", "title": "🌐 Change Language"}
-            ]
-        )
+        rows = [
+            {"id": "register", "title": "📝 Register Devotee"},
+            {"id": "history", "title": "📜 History"},
+            {"id": "next_tithi", "title": "🌕 Know Next Tithi"},
+            {"id": "change_lang", "title": "🌐 Change Language"}
+        ]
+        if offerings_enabled():
+            rows.insert(3, {"id": "offerings", "title": "🙏 Book a Seva"})
+        send_list(phone, header_en, rows)
 
 # =====================================================
 # HEALTH
@@ -224,6 +337,55 @@ async def health_check():
         logger.error(f"Health check failed: {e}")
         return {"status": "unhealthy", "database": "disconnected"}
 
+
+@app.get("/ready")
+def readiness_check():
+    """
+    Not ready while MongoDB is unreachable or its breaker is open. An open
+    Graph API breaker only degrades: replies wait in the outbox.
+    """
+    breakers = resilience_service.metrics()
+    database = "connected"
+
+    if resilience_service.mongo_breaker.is_open():
+        database = "circuit open"
+    else:
+        try:
+            with pymongo.timeout(2):
+                client.admin.command("ping")
+        except Exception as e:
+            logger.error(f"Readiness check failed: {e}")
+            database = "disconnected"
+
+    graph_open = resilience_service.graph_breaker.is_open()
+    ready = database == "connected" and (outbox is not None or not graph_open)
+    body = {
+        "status": ("degraded" if graph_open else "ready") if ready else "not ready",
+        "database": database,
+        "breakers": breakers,
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+
+@app.get("/metrics/resilience")
+async def resilience_metrics(request: Request):
+    require_admin(request)
+    return resilience_service.metrics()
+
+
+@app.get("/metrics/traffic")
+async def traffic_metrics(request: Request):
+    require_admin(request)
+    return traffic_service.metrics()
+
+
+@app.get("/metrics/outbox")
+async def outbox_metrics(request: Request):
+    require_admin(request)
+    if not outbox:
+        return {"enabled": False}
+    return {"enabled": OUTBOX_ENABLED, **outbox.metrics()}
+
 # =====================================================
 # DEPENDENCY INJECTION INTO ROUTER
 # =====================================================
@@ -240,3 +402,5 @@ init_dependencies(
     send_main_menu,
     send_language_selection
 )
+
+init_admin_dependencies(devotees, admin_users)
@@ -0,0 +1,148 @@
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import hmac
+import logging
+import os
+
+from app.services.devotee import search_devotees, stream_export
+from app.services import analytics_service
+from app.services.credential_service import verify_key
+from app.services.profiling_service import run_profile, slow_requests
+
+# =====================================================
+# ROUTER & GLOBALS
+# =====================================================
+
+router = APIRouter(prefix="/admin")
+logger = logging.getLogger("TempleBot")
+
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+devotees = None
+admin_users = None
+
+
+def init_dependencies(devotees_collection, admin_users_collection):
+    global devotees, admin_users
+    devotees = devotees_collection
+    admin_users = admin_users_collection
+
+
+# =====================================================
+# AUTH
+# =====================================================
+
+def require_admin(request: Request):
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    # Bytes, because compare_digest rejects non-ASCII str with TypeError.
+    supplied = request.headers.get("X-Admin-Key", "")
+    if not hmac.compare_digest(supplied.encode(), ADMIN_API_KEY.encode()):
+        logger.warning("Rejected admin API request")
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+async def require_dev_admin(request: Request):
+    """
+    Diagnostics expose code and timing details, so on top of the API key
+    they need a dev_admin's phone and personal key, as on WhatsApp.
+    """
+    require_admin(request)
+
+    phone = request.headers.get("X-Dev-Admin-Phone", "")
+    key = request.headers.get("X-Dev-Admin-Key", "")
+    admin = admin_users.find_one({"phone": phone, "active": True}) if phone and key else None
+
+    if not admin or admin.get("role") != "dev_admin":
+        logger.warning("Rejected diagnostics request")
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    matches, _ = await verify_key(key, admin.get("personal_key_hash"))
+    if not matches:
+        logger.warning(f"Rejected diagnostics request for {phone}")
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+# =====================================================
+# DEVOTEE DIRECTORY
+# =====================================================
+
+@router.get("/devotees")
+def list_devotees(
+    request: Request,
+    name: str = None,
+    gotram: str = None,
+    mobile: str = None,
+    q: str = None,
+    cursor: str = None,
+    limit: int = 50,
+):
+    require_admin(request)
+
+    try:
+        return search_devotees(devotees, name, gotram, mobile, q, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/devotees/export")
+def export_devotees(
+    request: Request,
+    format: str = "csv",
+    name: str = None,
+    gotram: str = None,
+    mobile: str = None,
+    q: str = None,
+):
+    require_admin(request)
+
+    try:
+        stream = stream_export(devotees, format, name=name, gotram=gotram, mobile=mobile, text=q)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="devotees.{format}"'},
+    )
+
+
+# =====================================================
+# USAGE ANALYTICS
+# =====================================================
+
+@router.get("/analytics")
+def usage_analytics(request: Request, days: int = 7):
+    require_admin(request)
+
+    if not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+
+    return {"days": analytics_service.read_rollups(days)}
+
+
+# =====================================================
+# DIAGNOSTICS (dev_admin)
+# =====================================================
+
+@router.post("/profile")
+async def profile(request: Request, seconds: float = 10, interval_ms: float = None, all_workers: bool = True):
+    """Samples stacks for `seconds`; returns collapsed stacks for flamegraph.pl or speedscope."""
+    await require_dev_admin(request)
+
+    try:
+        stacks, workers = await run_profile(seconds, interval_ms, all_workers)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return PlainTextResponse(stacks, headers={"X-Profile-Workers": str(workers)})
+
+
+@router.get("/slow-requests")
+async def list_slow_requests(request: Request):
+    await require_dev_admin(request)
+    return {"requests": slow_requests()}
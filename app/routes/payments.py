@@ -0,0 +1,94 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse
+from starlette.concurrency import run_in_threadpool
+import html
+import json
+import logging
+
+from app.services import offering_service
+from app.services.offering_service import (
+    SEVAS,
+    verify_razorpay_signature,
+    handle_payment_event,
+)
+
+# =====================================================
+# ROUTER & GLOBALS
+# =====================================================
+
+router = APIRouter()
+logger = logging.getLogger("TempleBot")
+
+
+# =====================================================
+# RAZORPAY WEBHOOK
+# =====================================================
+
+@router.post("/razorpay/webhook")
+async def razorpay_webhook(request: Request):
+    body = await request.body()
+
+    if not verify_razorpay_signature(body, request.headers.get("X-Razorpay-Signature")):
+        logger.warning("Invalid Razorpay webhook signature")
+        return {"status": "invalid signature"}
+
+    event = json.loads(body)
+    event_id = request.headers.get("X-Razorpay-Event-Id")
+
+    status = await run_in_threadpool(handle_payment_event, event_id, event)
+    return {"status": status}
+
+
+# =====================================================
+# CHECKOUT PAGE
+# =====================================================
+
+CHECKOUT_PAGE = """<!doctype html>
+<html>
+<head>
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<script src="https://checkout.razorpay.com/v1/checkout.js"></script>
+</head>
+<body style="font-family: sans-serif; text-align: center; padding-top: 3em">
+<h2>🛕 {title}</h2>
+<p>₹{amount}</p>
+<button id="pay" style="font-size: 1.2em; padding: 0.5em 2em">Pay</button>
+<script>
+var rzp = new Razorpay({{
+  key: "{key_id}",
+  order_id: "{order_id}",
+  amount: {amount_paise},
+  currency: "INR",
+  name: "Sri Parvati Jadala Ramalingeshwara Swamy Temple",
+  description: "{title}",
+  handler: function () {{
+    document.body.innerHTML = "<h2>🙏 Thank you. Your booking will be confirmed on WhatsApp.</h2>";
+  }}
+}});
+document.getElementById("pay").onclick = function (e) {{ rzp.open(); e.preventDefault(); }};
+</script>
+</body>
+</html>
+"""
+
+
+@router.get("/pay/{offering_id}")
+def checkout(offering_id: str):
+    offerings = offering_service.offerings
+    offering = offerings.find_one({"offering_id": offering_id}) if offerings is not None else None
+
+    if not offering or offering.get("status") not in ("pending", "paid"):
+        return HTMLResponse("<h2>This payment link is not valid.</h2>", status_code=404)
+
+    if offering["status"] == "paid":
+        return HTMLResponse("<h2>🙏 This offering is already paid.</h2>")
+
+    seva = SEVAS.get(offering["seva_id"], {})
+    return HTMLResponse(CHECKOUT_PAGE.format(
+        title=html.escape(seva.get("name_en", offering["seva_id"])),
+        amount=offering["amount"] // 100,
+        amount_paise=offering["amount"],
+        key_id=html.escape(offering_service.RAZORPAY_KEY_ID or ""),
+        order_id=html.escape(offering["razorpay_order_id"]),
+    ))
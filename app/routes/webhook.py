@@ -1,14 +1,36 @@
 from fastapi import APIRouter, Request
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import logging
 import os
 import hmac
 import hashlib
 import json
+import time
 from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
 
-from app.services.whatsapp_service import normalize_phone, send_text, send_image
+from app.services.whatsapp_service import normalize_phone, send_text, send_list
+from app.services.media_service import send_cached_image
 from app.services.tithi_service import get_next_tithi
+from app.services.credential_service import hash_key, verify_and_upgrade
+from app.services.capture_service import capture_request
+from app.services.intent_service import match_intent
+from app.services import traffic_service
+from app.services.traffic_service import limiter, load_monitor
+from app.services import analytics_service
+from app.services.profiling_service import annotate, begin_trace, end_trace, stage
+from app.services.resilience_service import (
+    begin_budget,
+    end_budget,
+    is_mongo_outage,
+    mongo_breaker
+)
+from app.services.offering_service import (
+    SEVAS,
+    create_offering,
+    offerings_enabled,
+    payment_url
+)
 from app.services.registration_service import (
     start_registration,
     handle_registration,
@@ -117,14 +139,30 @@ async def verify(request: Request):
 
 @router.post("/webhook")
 async def webhook(request: Request):
+    # Per-stage timings; slow requests land in the profiling ring buffer.
+    trace = begin_trace()
+    # Graph API and Razorpay timeouts are capped by what is left of the
+    # budget; MongoDB calls have their own per-operation timeout.
+    begin_budget()
+    try:
+        return await process_webhook(request)
+    finally:
+        end_budget()
+        end_trace(trace)
+
+
+async def process_webhook(request: Request):
     body = await request.body()
 
-    if not verify_signature(request, body):
-        logger.warning("Invalid webhook signature")
-        return {"status": "invalid signature"}
+    with stage("signature"):
+        if not verify_signature(request, body):
+            logger.warning("Invalid webhook signature")
+            return {"status": "invalid signature"}
 
-    data = json.loads(body)
-    logger.info(f"WEBHOOK RECEIVED: {data}")
+    with stage("parse"):
+        data = json.loads(body)
+        logger.info(f"WEBHOOK RECEIVED: {data}")
+        capture_request(request.headers, data)
 
     try:
         entry = data.get("entry", [])
@@ -137,40 +175,121 @@ async def webhook(request: Request):
             return {"status": "no message"}
 
         message = value["messages"][0]
+        sender = normalize_phone(message["from"])
 
-        message_id = message.get("id")
-
-        if message_id and processed_messages is not None:
-            if processed_messages.find_one({"message_id": message_id}):
-                logger.info(f"Duplicate message ignored: {message_id}")
-                return {"status": "duplicate"}
-
-            processed_messages.insert_one({
-                "message_id": message_id
-            })
+        # Checked in memory before any database work.
+        allowed, notify = limiter.check(sender)
+        if not allowed:
+            traffic_service.counters["throttled"] += 1
+            if notify:
+                traffic_service.counters["slow_down_sent"] += 1
+                send_text(sender, traffic_service.SLOW_DOWN_TEXT)
+            return {"status": "throttled"}
+
+        # Shed before any database work, and before dedup so the message
+        # is not marked handled: a non-2xx makes Meta redeliver it once the
+        # load has passed. Menu requests get the static menu; each other
+        # sender gets one note per episode.
+        if load_monitor.shedding:
+            intent = routed_intent(message)
+            if intent in traffic_service.SHED_MENU_INTENTS:
+                traffic_service.counters["shed_menu_sent"] += 1
+                send_main_menu(sender, lang="en")
+                return {"status": "shed menu"}
+            if not is_cheap(intent):
+                traffic_service.counters["shed"] += 1
+                if load_monitor.should_tell(sender):
+                    traffic_service.counters["busy_sent"] += 1
+                    send_text(sender, traffic_service.BUSY_TEXT)
+                return JSONResponse(status_code=503, content={"status": "shed"})
+
+        # Fail fast while MongoDB is down; Meta redelivers after a non-2xx.
+        if not mongo_breaker.allow():
+            return JSONResponse(status_code=503, content={"status": "unavailable"})
 
-        sender = normalize_phone(message["from"])
+        message_id = message.get("id")
+        annotate(message_id=message_id, type=message.get("type"))
+
+        # The dedup write doubles as the breaker's health probe. Any other
+        # outcome (an outage is recorded below, a cancelled request) must
+        # still end a half-open trial.
+        probed = False
+        try:
+            if message_id and processed_messages is not None:
+                # The unique index makes this the claim: with several workers,
+                # exactly one insert succeeds for a given message.
+                try:
+                    with stage("dedup"):
+                        processed_messages.insert_one({
+                            "message_id": message_id
+                        })
+                except DuplicateKeyError:
+                    mongo_breaker.record_success()
+                    probed = True
+                    logger.info(f"Duplicate message ignored: {message_id}")
+                    return {"status": "duplicate"}
+
+            mongo_breaker.record_success()
+            probed = True
+        finally:
+            if not probed:
+                mongo_breaker.release()
+
+        started = time.perf_counter()
 
         if message.get("type") == "text":
-            handle_text(sender, message["text"]["body"])
+            option = await handle_text(sender, message["text"]["body"])
+            analytics_service.record_message(
+                sender, "text", option, (time.perf_counter() - started) * 1000
+            )
 
         elif message.get("type") == "interactive":
             interactive = message.get("interactive", {})
             list_reply = interactive.get("list_reply")
             if list_reply:
-                handle_navigation(sender, list_reply.get("id"))
-
-    except Exception:
-        logger.exception("Webhook processing error")
+                selected = list_reply.get("id")
+                annotate(option=selected)
+                await handle_navigation(sender, selected)
+                analytics_service.record_message(
+                    sender, "interactive",
+                    analytics_service.option_name(selected, {f"seva_{s}" for s in SEVAS}),
+                    (time.perf_counter() - started) * 1000
+                )
+
+    except Exception as e:
+        if is_mongo_outage(e):
+            mongo_breaker.record_failure()
+            logger.exception("Webhook processing error: MongoDB unavailable")
+        else:
+            logger.exception("Webhook processing error")
 
     return {"status": "ok"}
 
 
+def routed_intent(message: dict):
+    """The menu option a message leads to, worked out without the database."""
+    if message.get("type") == "interactive":
+        list_reply = message.get("interactive", {}).get("list_reply") or {}
+        return list_reply.get("id")
+    if message.get("type") == "text":
+        text = (message.get("text") or {}).get("body", "")
+        if text.lower().startswith("admin "):
+            return None
+        return match_intent(text)
+    return None
+
+
+def is_cheap(intent: str) -> bool:
+    """Whether a routed intent is still served while shedding (see CHEAP_OPTIONS)."""
+    return intent in traffic_service.CHEAP_OPTIONS
+
+
 # =====================================================
 # TEXT HANDLER
 # =====================================================
 
-def handle_text(sender: str, text: str):
+async def handle_text(sender: str, text: str):
+    """Returns the menu intent the text was routed to, if any."""
 
     # -------------------------------------------------
     # ADMIN LOGIN (admin <personal_key>)
@@ -182,14 +301,13 @@ def handle_text(sender: str, text: str):
             return
 
         key = parts[1].strip()
-        key_hash = hashlib.sha256(key.encode()).hexdigest()
 
         admin = admin_users.find_one({
             "phone": sender,
             "active": True
         })
 
-        if not admin or admin.get("personal_key_hash") != key_hash:
+        if not await verify_and_upgrade(sender, key, admin, admin_users):
             membership_audit_logs.insert_one({
                 "phone": sender,
                 "action": "admin_login_failed",
@@ -224,11 +342,12 @@ def handle_text(sender: str, text: str):
     # -------------------------------------------------
     # CHECK ACTIVE ADMIN SESSION
     # -------------------------------------------------
-    active_session = admin_sessions.find_one({
-        "phone": sender,
-        "active": True,
-        "expires_at": {"$gt": datetime.utcnow()}
-    })
+    with stage("admin_check"):
+        active_session = admin_sessions.find_one({
+            "phone": sender,
+            "active": True,
+            "expires_at": {"$gt": datetime.utcnow()}
+        })
 
     if active_session:
         admin_sessions.update_one(
@@ -316,7 +435,7 @@ def handle_text(sender: str, text: str):
             return
 
         if create_step == "enter_key":
-            new_key_hash = hashlib.sha256(text.strip().encode()).hexdigest()
+            new_key_hash = await hash_key(text.strip())
 
             new_phone = active_session.get("new_admin_phone")
             new_role = active_session.get("new_admin_role")
@@ -351,11 +470,9 @@ def handle_text(sender: str, text: str):
         step = active_session.get("key_change_step")
 
         if step == "verify_old":
-            current_hash = hashlib.sha256(text.strip().encode()).hexdigest()
-
             admin = admin_users.find_one({"phone": sender})
 
-            if not admin or admin.get("personal_key_hash") != current_hash:
+            if not await verify_and_upgrade(sender, text.strip(), admin, admin_users):
                 send_text(sender, "Incorrect current key.")
                 return
 
@@ -367,7 +484,7 @@ def handle_text(sender: str, text: str):
             return
 
         if step == "enter_new":
-            new_hash = hashlib.sha256(text.strip().encode()).hexdigest()
+            new_hash = await hash_key(text.strip())
 
             admin_users.update_one(
                 {"phone": sender},
@@ -392,18 +509,33 @@ def handle_text(sender: str, text: str):
             send_text(sender, "Key updated successfully. Please login again.")
             return
 
+        # -----------------------------
+        # USAGE STATS (stats [days])
+        # -----------------------------
+        if text.strip().lower().split(" ")[0] == "stats":
+            parts = text.strip().split()
+            days = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 7
+            rows = analytics_service.read_rollups(min(max(days, 1), 31))
+            send_text(sender, analytics_service.format_summary(rows))
+            return
+
         # -----------------------------
         # DEFAULT ADMIN RESPONSE
         # -----------------------------
         send_text(sender, "Admin command received.")
         return
 
-    if sender in registration_sessions:
-        return handle_registration(sender, text, devotees, send_main_menu)
+    with stage("session"):
+        in_registration = sender in registration_sessions
+
+    if in_registration:
+        handle_registration(sender, text, devotees, send_main_menu)
+        return None
 
-    lower = text.strip().lower()
+    # Greetings, typos and Telugu keywords map straight to menu options.
+    intent = match_intent(text)
 
-    if lower in ["hi", "hello", "namaste", "start"]:
+    if intent == "greeting":
         from app.services.session_service import get_language
 
         lang = get_language(sender, sessions)
@@ -411,24 +543,29 @@ def handle_text(sender: str, text: str):
         # If no language set yet → new user
         if not lang:
             send_language_selection(sender)
-            return
+            return intent
 
         # Existing user → go to main menu
         send_main_menu(sender)
-        return
+        return intent
 
-    if lower in ["menu", "main menu"]:
+    if intent == "menu" or (intent == "offerings" and not offerings_enabled()):
         send_main_menu(sender)
-        return
+        return intent
+
+    if intent:
+        await handle_navigation(sender, intent)
+        return intent
 
     send_text(sender, "Please use menu options.")
+    return None
 
 
 # =====================================================
 # NAVIGATION HANDLER
 # =====================================================
 
-def handle_navigation(phone: str, selected: str):
+async def handle_navigation(phone: str, selected: str):
 
     if not selected:
         return
@@ -474,20 +611,51 @@ def handle_navigation(phone: str, selected: str):
         lang = get_language(phone, sessions)
 
         if lang == "tel":
-            send_image(
-                phone,
-                "https://pub-d1d3a6c8900e4412aac6397524edd899.r2.dev/SPJRSD%20Temple%20History%20TEL%20(1).PNG",
-                "స్థలపురాణము",
-            )
+            send_cached_image(phone, "history_tel", "స్థలపురాణము")
         else:
-            send_image(
-                phone,
-                "https://pub-d1d3a6c8900e4412aac6397524edd899.r2.dev/SPJRSD%20Temple%20History%20ENG%20(1).PNG",
-                "Temple History",
-            )
+            send_cached_image(phone, "history_en", "Temple History")
 
         send_main_menu(phone)
         return
 
+    if selected == "offerings" and offerings_enabled():
+        from app.services.session_service import get_language
+
+        lang = get_language(phone, sessions)
+        rows = [
+            {
+                "id": f"seva_{seva_id}",
+                "title": f"{seva['name_tel'] if lang == 'tel' else seva['name_en']} ₹{seva['amount_inr']}"[:24]
+            }
+            for seva_id, seva in SEVAS.items()
+        ]
+
+        send_list(phone, "సేవను ఎంచుకోండి" if lang == "tel" else "Choose a Seva", rows)
+        return
+
+    if selected.startswith("seva_") and offerings_enabled():
+        seva_id = selected[len("seva_"):]
+
+        if seva_id not in SEVAS:
+            send_text(phone, "Invalid option selected.")
+            send_main_menu(phone)
+            return
+
+        try:
+            offering = await create_offering(phone, seva_id)
+        except Exception:
+            logger.exception(f"Offering creation failed for {seva_id}")
+            send_text(phone, "⚠️ Unable to start payment right now. Please try again later.")
+            send_main_menu(phone)
+            return
+
+        seva = SEVAS[seva_id]
+        send_text(
+            phone,
+            f"🙏 {seva['name_en']} - ₹{seva['amount_inr']}\n\n"
+            f"Complete your offering here:\n{payment_url(offering['offering_id'])}"
+        )
+        return
+
     send_text(phone, "Invalid option selected.")
     send_main_menu(phone)
@@ -0,0 +1,328 @@
+import logging
+import os
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger("TempleBot")
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "true").lower() == "true"
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "10"))
+
+# Days are counted in temple local time.
+IST = timedelta(hours=5, minutes=30)
+
+# Only known menu ids become rollup fields, so a client sending arbitrary
+# list ids cannot grow the daily document.
+TRACKED_OPTIONS = {
+    "register", "history", "next_tithi", "change_lang",
+    "lang_en", "lang_tel", "offerings",
+}
+
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500)
+
+# Session languages counted in the daily split; anything else is "en",
+# as in get_language.
+LANGUAGES = ("en", "tel")
+
+# Each day document remembers the ids of its last few applied writes, so a
+# write retried after an ambiguous failure is never counted twice.
+APPLIED_WRITES_KEPT = 50
+MAX_RETRY_WRITES = 10000
+
+daily = None
+active_users = None
+sessions = None
+
+# Field path in the day document -> pending increment, per day.
+_pending = {}
+_pending_max = {}
+_pending_users = set()
+# (day, update) pairs whose outcome is unknown; resent unchanged.
+_retry = []
+_lock = threading.Lock()
+_stop = threading.Event()
+_thread = None
+
+
+def init_analytics(daily_collection, active_users_collection, sessions_collection=None):
+    global daily, active_users, sessions
+    daily = daily_collection
+    active_users = active_users_collection
+    sessions = sessions_collection
+    # One marker per user per day, only needed until that day is counted.
+    active_users.create_index("created_at", expireAfterSeconds=3 * 86400)
+    active_users.create_index([("day", 1), ("lang", 1)])
+
+
+def day_key(now: datetime = None) -> str:
+    return ((now or datetime.utcnow()) + IST).strftime("%Y-%m-%d")
+
+
+def latency_bucket(ms: float) -> str:
+    for bound in LATENCY_BUCKETS_MS:
+        if ms <= bound:
+            return f"le_{bound}"
+    return f"gt_{LATENCY_BUCKETS_MS[-1]}"
+
+
+# =====================================================
+# RECORDING (in memory, no database access)
+# =====================================================
+
+def _inc(day, field, amount=1):
+    counts = _pending.get(day)
+    if counts is None:
+        counts = _pending[day] = Counter()
+    counts[field] += amount
+
+
+def record_message(phone: str, kind: str, option: str = None, latency_ms: float = None):
+    """Called once per handled inbound message."""
+    if daily is None or not ANALYTICS_ENABLED:
+        return
+
+    day = day_key()
+
+    with _lock:
+        _inc(day, "messages.total")
+        _inc(day, f"messages.{kind}")
+        _pending_users.add((day, phone))
+
+        if option:
+            _inc(day, f"options.{option}")
+
+        if latency_ms is not None:
+            _inc(day, "latency.count")
+            _inc(day, "latency.total_ms", round(latency_ms, 1))
+            _inc(day, f"latency.buckets.{latency_bucket(latency_ms)}")
+            key = (day, "latency.max_ms")
+            _pending_max[key] = max(_pending_max.get(key, 0), round(latency_ms, 1))
+
+
+def record_event(name: str):
+    """Counts a business event such as a completed registration."""
+    if daily is None or not ANALYTICS_ENABLED:
+        return
+    with _lock:
+        _inc(day_key(), f"events.{name}")
+
+
+def option_name(selected: str, extra: set = ()) -> str:
+    if selected in TRACKED_OPTIONS or selected in extra:
+        return selected
+    return "other"
+
+
+# =====================================================
+# FLUSHING
+# =====================================================
+
+def _day_update(day, inc, maxes, sets=None):
+    """One idempotent day write: applied at most once, tagged by write id."""
+    write_id = uuid.uuid4().hex
+    update = {
+        "$set": {**(sets or {}), "updated_at": datetime.utcnow()},
+        "$push": {"applied_writes": {"$each": [write_id], "$slice": -APPLIED_WRITES_KEPT}},
+    }
+    if inc:
+        update["$inc"] = inc
+    if maxes:
+        update["$max"] = maxes
+    return day, write_id, update
+
+
+def _session_languages(phones) -> dict:
+    """phone -> session language, in one read for the whole flush."""
+    if sessions is None:
+        return {}
+    return {
+        doc["phone"]: doc.get("language")
+        for doc in sessions.find({"phone": {"$in": list(phones)}}, {"phone": 1, "language": 1})
+        if doc.get("language") in LANGUAGES
+    }
+
+
+def _count_active(users) -> dict:
+    """
+    Upserts one marker per (day, user), tagged with the user's current
+    session language, and returns per day the marker count and the count
+    per language. Both steps are idempotent, so a failed flush can simply
+    repeat them.
+    """
+    if not users:
+        return {}
+    languages = _session_languages({phone for _, phone in users})
+    active_users.bulk_write([
+        UpdateOne(
+            {"_id": f"{day}:{phone}"},
+            {
+                "$setOnInsert": {"day": day, "created_at": datetime.utcnow()},
+                "$set": {"lang": languages.get(phone, "en")},
+            },
+            upsert=True,
+        )
+        for day, phone in users
+    ], ordered=False)
+    return {
+        day: {
+            "active_users": active_users.count_documents({"day": day}),
+            **{f"languages.{lang}": active_users.count_documents({"day": day, "lang": lang}) for lang in LANGUAGES},
+        }
+        for day in {day for day, _ in users}
+    }
+
+
+def _write_days(writes) -> list:
+    """Sends the day writes; returns those that must be retried."""
+    if not writes:
+        return []
+
+    ops = [
+        UpdateOne({"_id": day, "applied_writes": {"$ne": write_id}}, update, upsert=True)
+        for day, write_id, update in writes
+    ]
+    try:
+        daily.bulk_write(ops, ordered=False)
+        return []
+    except BulkWriteError as e:
+        failed = [writes[error["index"]] for error in e.details.get("writeErrors", [])]
+    except Exception:
+        logger.exception("Analytics flush failed; retrying the same writes next flush")
+        return list(writes)
+
+    retry = []
+    for day, write_id, update in failed:
+        # A duplicate key means the filter missed: either this write was
+        # already applied, or another worker created the day document first.
+        if daily.find_one({"_id": day, "applied_writes": write_id}, {"_id": 1}) is None:
+            retry.append((day, write_id, update))
+    return retry
+
+
+def flush():
+    """
+    Writes everything recorded since the last flush: one `$inc`/`$max`
+    upsert per day plus one marker upsert per new (day, user) pair. Active
+    users are set from the day's marker count with `$max`, and each day
+    write carries an id it may be applied under only once, so retrying any
+    part of a failed flush never counts anything twice. The language split
+    is recounted from the markers and set outright, since a user who
+    switches language moves from one count to the other.
+    """
+    global _pending, _pending_max, _pending_users, _retry
+
+    with _lock:
+        pending, _pending = _pending, {}
+        pending_max, _pending_max = _pending_max, {}
+        users, _pending_users = _pending_users, set()
+        retry, _retry = _retry, []
+
+    if not pending and not users and not retry:
+        return 0
+
+    try:
+        active = _count_active(users)
+    except Exception:
+        logger.exception("Analytics marker write failed; keeping users for the next flush")
+        active = {}
+        with _lock:
+            _pending_users.update(users)
+
+    writes = list(retry)
+    for day in sorted(set(pending) | set(active) | {day for day, _ in pending_max}):
+        maxes = {field: value for (d, field), value in pending_max.items() if d == day}
+        sets = {}
+        if day in active:
+            counts = dict(active[day])
+            maxes["active_users"] = counts.pop("active_users")
+            sets = counts
+        writes.append(_day_update(day, dict(pending.get(day, {})), maxes, sets))
+
+    failed = _write_days(writes)
+    if failed:
+        if len(failed) > MAX_RETRY_WRITES:
+            logger.error(f"Dropping {len(failed) - MAX_RETRY_WRITES} analytics writes after repeated failures")
+            failed = failed[-MAX_RETRY_WRITES:]
+        with _lock:
+            _retry = failed + _retry
+
+    return len(writes) - len(failed)
+
+
+def _run():
+    while not _stop.wait(ANALYTICS_FLUSH_SECONDS):
+        flush()
+
+
+def start_flusher():
+    global _thread
+    if daily is None or not ANALYTICS_ENABLED or (_thread and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="analytics-flush", daemon=True)
+    _thread.start()
+
+
+def stop_flusher():
+    _stop.set()
+    if _thread:
+        _thread.join(5)
+    flush()
+
+
+# =====================================================
+# READING
+# =====================================================
+
+def read_rollups(days: int = 7) -> list:
+    """Daily rollups for the last `days` days, newest first: O(days) reads."""
+    today = datetime.utcnow()
+    keys = [day_key(today - timedelta(days=i)) for i in range(days)]
+    docs = {doc["_id"]: doc for doc in daily.find({"_id": {"$in": keys}})}
+
+    rows = []
+    for key in keys:
+        doc = docs.get(key, {})
+        latency = doc.get("latency", {})
+        count = latency.get("count", 0)
+        rows.append({
+            "day": key,
+            "active_users": doc.get("active_users", 0),
+            "messages": doc.get("messages", {}),
+            "options": doc.get("options", {}),
+            "events": doc.get("events", {}),
+            "languages": doc.get("languages", {}),
+            "latency": {
+                "count": count,
+                "avg_ms": round(latency.get("total_ms", 0) / count, 1) if count else None,
+                "max_ms": latency.get("max_ms"),
+                "buckets": latency.get("buckets", {}),
+            },
+        })
+    return rows
+
+
+def format_summary(rows: list) -> str:
+    """Short plain-text summary for the WhatsApp admin command."""
+    lines = []
+    for row in rows:
+        options = row["options"]
+        top = ", ".join(f"{k} {v}" for k, v in sorted(options.items(), key=lambda kv: -kv[1])[:3])
+        avg = row["latency"]["avg_ms"]
+        lines.append(
+            f"📅 {row['day']}: {row['active_users']} users, "
+            f"{row['messages'].get('total', 0)} msgs, "
+            f"{row['events'].get('registration', 0)} reg"
+            + (f", avg {avg:.0f} ms" if avg is not None else "")
+            + (f"\n   {top}" if top else "")
+        )
+    return "\n".join(lines) or "No activity recorded."
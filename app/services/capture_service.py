@@ -0,0 +1,184 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+
+from app.services.intent_service import match_intent
+
+logger = logging.getLogger("TempleBot")
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+# When set, every inbound webhook is appended (PII scrubbed) to this file
+# as one compact JSON line. Replay it with `python -m app.tools.replay`.
+CAPTURE_FILE = os.getenv("WEBHOOK_CAPTURE_FILE")
+# Keys the phone pseudonyms. Without a configured secret, a random salt is
+# drawn per process and never written anywhere, so a capture file alone
+# cannot be brute-forced back to the 10-digit numbers.
+CAPTURE_SALT = os.getenv("WEBHOOK_CAPTURE_SALT") or secrets.token_hex(16)
+
+CAPTURED_HEADERS = ("content-type", "user-agent")
+
+# Lines waiting for the writer thread; full means the disk cannot keep up.
+CAPTURE_QUEUE_SIZE = 10000
+
+_queue = queue.Queue(maxsize=CAPTURE_QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+dropped = 0
+
+if CAPTURE_FILE and not os.getenv("WEBHOOK_CAPTURE_SALT"):
+    logger.warning("WEBHOOK_CAPTURE_SALT not set — phone pseudonyms only match within this process")
+
+
+# =====================================================
+# SCRUBBING (allow-list: only what replay needs)
+# =====================================================
+
+def pseudonymize_phone(phone: str) -> str:
+    """Stable fake number so per-sender behaviour survives scrubbing."""
+    digest = hmac.new(CAPTURE_SALT.encode(), phone.encode(), hashlib.sha256).hexdigest()
+    return "91" + str(int(digest[:15], 16))[-10:].rjust(10, "0")
+
+
+def pseudonymize_id(message_id: str) -> str:
+    """Message ids embed the sender's number; keep them unique, not readable."""
+    digest = hmac.new(CAPTURE_SALT.encode(), message_id.encode(), hashlib.sha256).hexdigest()
+    return f"wamid.capture.{digest[:24]}"
+
+
+def scrub_text(text: str) -> str:
+    """Keeps text the intent matcher routes (it drives replay); redacts the rest."""
+    if not text.lower().startswith("admin ") and match_intent(text) is not None:
+        return text
+    return f"<redacted:{len(text)}>"
+
+
+def _scrub_message(message: dict) -> dict:
+    kind = message.get("type")
+    scrubbed = {"type": kind}
+    if "from" in message:
+        scrubbed["from"] = pseudonymize_phone(message["from"])
+    if "id" in message:
+        scrubbed["id"] = pseudonymize_id(message["id"])
+    if "timestamp" in message:
+        scrubbed["timestamp"] = message["timestamp"]
+
+    if kind == "text":
+        scrubbed["text"] = {"body": scrub_text((message.get("text") or {}).get("body", ""))}
+    elif kind == "interactive":
+        interactive = message.get("interactive") or {}
+        scrubbed["interactive"] = {"type": interactive.get("type")}
+        for reply in ("list_reply", "button_reply"):
+            if reply in interactive:
+                # Ids are our own menu option ids; titles are dropped.
+                scrubbed["interactive"][reply] = {"id": (interactive[reply] or {}).get("id")}
+    elif kind == "button":
+        scrubbed["button"] = {"payload": (message.get("button") or {}).get("payload")}
+    # Every other type (image, location, contacts, document, ...) keeps
+    # only its type: captions, coordinates and shared contacts are PII.
+    return scrubbed
+
+
+def scrub_payload(data: dict) -> dict:
+    entries = []
+    for entry in data.get("entry", []):
+        changes = []
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            kept = {}
+
+            if "contacts" in value:
+                kept["contacts"] = [
+                    {"wa_id": pseudonymize_phone(c["wa_id"])} for c in value["contacts"] if "wa_id" in c
+                ]
+            if "messages" in value:
+                kept["messages"] = [_scrub_message(m) for m in value["messages"]]
+            if "statuses" in value:
+                kept["statuses"] = [
+                    {
+                        "id": pseudonymize_id(s.get("id", "")),
+                        "status": s.get("status"),
+                        "timestamp": s.get("timestamp"),
+                        "recipient_id": pseudonymize_phone(s.get("recipient_id", "")),
+                    }
+                    for s in value["statuses"]
+                ]
+
+            changes.append({"field": change.get("field"), "value": kept})
+        entries.append({"changes": changes})
+
+    return {"object": data.get("object"), "entry": entries}
+
+
+# =====================================================
+# CAPTURE (written by a background thread)
+# =====================================================
+
+def _write_loop():
+    while True:
+        lines = [_queue.get()]
+        try:
+            while True:
+                try:
+                    lines.append(_queue.get_nowait())
+                except queue.Empty:
+                    break
+            with open(CAPTURE_FILE, "a", encoding="utf-8") as f:
+                f.write("".join(line + "\n" for line in lines))
+        except Exception as e:
+            logger.error(f"Webhook capture write failed: {e}")
+        finally:
+            for _ in lines:
+                _queue.task_done()
+
+
+def _ensure_writer():
+    global _writer
+    if _writer and _writer.is_alive():
+        return
+    with _writer_lock:
+        if not (_writer and _writer.is_alive()):
+            _writer = threading.Thread(target=_write_loop, name="webhook-capture", daemon=True)
+            _writer.start()
+
+
+def capture_request(headers, data: dict):
+    """Scrubs and queues one webhook; the file write happens off the event loop."""
+    global dropped
+    if not CAPTURE_FILE:
+        return
+
+    try:
+        record = {
+            "ts": round(time.time(), 3),
+            "headers": {k: headers[k] for k in CAPTURED_HEADERS if k in headers},
+            "body": scrub_payload(data),
+        }
+        _ensure_writer()
+        _queue.put_nowait(json.dumps(record, separators=(",", ":"), ensure_ascii=False))
+
+    except queue.Full:
+        dropped += 1
+    except Exception as e:
+        logger.error(f"Webhook capture failed: {e}")
+
+
+def flush_capture():
+    """Blocks until every queued line is on disk."""
+    _queue.join()
+
+
+def read_capture(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
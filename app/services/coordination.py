@@ -0,0 +1,111 @@
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger("TempleBot")
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+# "single" keeps conversation state in process memory (one uvicorn worker).
+# "multi" moves it to MongoDB so any worker or node can serve any message.
+DEPLOYMENT_MODE = os.getenv("DEPLOYMENT_MODE", "single").lower()
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def is_multi_worker() -> bool:
+    return DEPLOYMENT_MODE == "multi"
+
+
+# =====================================================
+# LEASE LOCKS
+# =====================================================
+
+def ensure_lock_indexes(locks_collection):
+    # Expired leases are reaped by Mongo; acquire_lock also takes them over.
+    locks_collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+def acquire_lock(locks_collection, name: str, ttl_seconds: int = 60) -> bool:
+    """
+    Takes a named lease if it is free or expired. Exactly one caller wins
+    because _id is unique: losers either fail the filter or hit the key.
+    """
+    now = datetime.utcnow()
+
+    try:
+        locks_collection.find_one_and_update(
+            {"_id": name, "expires_at": {"$lt": now}},
+            {"$set": {
+                "owner": WORKER_ID,
+                "acquired_at": now,
+                "expires_at": now + timedelta(seconds=ttl_seconds),
+            }},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+
+    lock = locks_collection.find_one({"_id": name})
+    return bool(lock and lock.get("owner") == WORKER_ID)
+
+
+def release_lock(locks_collection, name: str):
+    locks_collection.delete_one({"_id": name, "owner": WORKER_ID})
+
+
+# =====================================================
+# SHARED CONVERSATION STATE
+# =====================================================
+
+class SessionStore:
+    """
+    Per-phone conversation state with a dict-like interface.
+
+    Backed by a plain dict until use_collection() is called, after which
+    every read and write goes to MongoDB. Callers must assign a session
+    back (store[phone] = session) after changing it.
+    """
+
+    def __init__(self, ttl_seconds: int = 86400):
+        self.ttl_seconds = ttl_seconds
+        self._memory = {}
+        self._collection = None
+
+    def use_collection(self, collection):
+        collection.create_index("phone", unique=True)
+        collection.create_index("updated_at", expireAfterSeconds=self.ttl_seconds)
+        self._collection = collection
+
+    def __contains__(self, phone):
+        if self._collection is None:
+            return phone in self._memory
+        return self._collection.find_one({"phone": phone}, {"_id": 1}) is not None
+
+    def get(self, phone, default=None):
+        if self._collection is None:
+            return self._memory.get(phone, default)
+        doc = self._collection.find_one({"phone": phone})
+        return doc["state"] if doc else default
+
+    def __setitem__(self, phone, state):
+        if self._collection is None:
+            self._memory[phone] = state
+            return
+        self._collection.update_one(
+            {"phone": phone},
+            {"$set": {"state": state, "updated_at": datetime.utcnow()}},
+            upsert=True,
+        )
+
+    def pop(self, phone, default=None):
+        if self._collection is None:
+            return self._memory.pop(phone, default)
+        doc = self._collection.find_one_and_delete({"phone": phone})
+        return doc["state"] if doc else default
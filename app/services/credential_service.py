@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import re
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("TempleBot")
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+# scrypt cost parameters. N must be a power of two; memory used per hash is
+# roughly 128 * N * r bytes (16 MiB with the defaults below).
+SCRYPT_N = int(os.getenv("KEY_HASH_SCRYPT_N", "16384"))
+SCRYPT_R = int(os.getenv("KEY_HASH_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("KEY_HASH_SCRYPT_P", "1"))
+SALT_BYTES = 16
+DKLEN = 32
+
+HASH_WORKERS = int(os.getenv("KEY_HASH_WORKERS", "2"))
+
+SCHEME = "scrypt"
+LEGACY_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="keyhash")
+
+
+# =====================================================
+# SYNC PRIMITIVES (run inside the thread pool)
+# =====================================================
+
+def _scrypt(key: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        key.encode(),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        maxmem=256 * n * r + 1024 * 1024,
+        dklen=DKLEN,
+    )
+
+
+def hash_key_sync(key: str, n: int = None, r: int = None, p: int = None) -> str:
+    n = n or SCRYPT_N
+    r = r or SCRYPT_R
+    p = p or SCRYPT_P
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = _scrypt(key, salt, n, r, p)
+    return f"{SCHEME}${n}${r}${p}${salt.hex()}${digest.hex()}"
+
+
+def verify_key_sync(key: str, stored_hash: str):
+    """
+    Returns (matches, needs_rehash).
+
+    needs_rehash is True for legacy unsalted SHA-256 hashes and for scrypt
+    hashes with any parameter below the current configuration. A hash
+    stronger than the configuration is left alone, so lowering the cost
+    never downgrades stored keys.
+    """
+    if not stored_hash:
+        return False, False
+
+    if LEGACY_SHA256.match(stored_hash):
+        legacy = hashlib.sha256(key.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored_hash), True
+
+    try:
+        scheme, n, r, p, salt_hex, digest_hex = stored_hash.split("$")
+        n, r, p = int(n), int(r), int(p)
+        salt = bytes.fromhex(salt_hex)
+        expected = bytes.fromhex(digest_hex)
+    except ValueError:
+        logger.error("Unrecognised key hash format")
+        return False, False
+
+    if scheme != SCHEME:
+        logger.error(f"Unsupported key hash scheme: {scheme}")
+        return False, False
+
+    matches = hmac.compare_digest(_scrypt(key, salt, n, r, p), expected)
+    needs_rehash = n < SCRYPT_N or r < SCRYPT_R or p < SCRYPT_P
+    return matches, needs_rehash
+
+
+def upgrade_params(stored_hash: str):
+    """(n, r, p) for a rehash: the configured cost, never below the stored one."""
+    try:
+        _, n, r, p, _, _ = stored_hash.split("$")
+        return max(int(n), SCRYPT_N), max(int(r), SCRYPT_R), max(int(p), SCRYPT_P)
+    except (AttributeError, ValueError):
+        return SCRYPT_N, SCRYPT_R, SCRYPT_P
+
+
+# =====================================================
+# ASYNC API (never blocks the event loop)
+# =====================================================
+
+async def hash_key(key: str, n: int = None, r: int = None, p: int = None) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, hash_key_sync, key, n, r, p)
+
+
+async def verify_key(key: str, stored_hash: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, verify_key_sync, key, stored_hash)
+
+
+async def verify_and_upgrade(phone: str, key: str, admin: dict, admin_users_collection) -> bool:
+    """
+    Verifies an admin key and, on success, transparently replaces a legacy
+    or outdated hash with one using the current scrypt parameters.
+    """
+    if not admin:
+        return False
+
+    stored_hash = admin.get("personal_key_hash")
+    matches, needs_rehash = await verify_key(key, stored_hash)
+
+    if matches and needs_rehash:
+        new_hash = await hash_key(key, *upgrade_params(stored_hash))
+        admin_users_collection.update_one(
+            {"phone": phone},
+            {"$set": {"personal_key_hash": new_hash}}
+        )
+        logger.info(f"Admin key hash upgraded for {phone}")
+
+    return matches
+
+
+# =====================================================
+# BENCHMARK / CALIBRATION
+# =====================================================
+
+def benchmark(n: int, r: int = 8, p: int = 1, rounds: int = 3) -> float:
+    """Average milliseconds per hash for the given parameters."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        hash_key_sync("benchmark-key", n=n, r=r, p=p)
+    return (time.perf_counter() - start) * 1000 / rounds
+
+
+def calibrate(target_ms: float = 100.0, r: int = 8, p: int = 1, max_n: int = 2 ** 20):
+    """
+    Picks the largest power-of-two N whose hash time stays within target_ms
+    on this machine. Returns (n, measured_ms).
+    """
+    n = 2 ** 10
+    best = (n, benchmark(n, r, p))
+
+    while n * 2 <= max_n:
+        elapsed = benchmark(n * 2, r, p)
+        if elapsed > target_ms:
+            break
+        n *= 2
+        best = (n, elapsed)
+
+    return best
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark admin key hashing cost")
+    parser.add_argument("--target-ms", type=float, default=100.0)
+    parser.add_argument("-r", type=int, default=SCRYPT_R)
+    parser.add_argument("-p", type=int, default=SCRYPT_P)
+    args = parser.parse_args()
+
+    n = 2 ** 10
+    while n <= 2 ** 18:
+        print(f"N={n:<8} r={args.r} p={args.p}  {benchmark(n, args.r, args.p):8.1f} ms")
+        n *= 2
+
+    best_n, best_ms = calibrate(args.target_ms, args.r, args.p)
+    print(f"\nRecommended: KEY_HASH_SCRYPT_N={best_n} ({best_ms:.1f} ms per hash)")
@@ -1 +1,258 @@
+import base64
+import csv
+import io
+import json
+import logging
+import re
+import threading
 
+from bson import ObjectId
+
+from app.services.whatsapp_service import normalize_phone
+
+logger = logging.getLogger("TempleBot")
+
+EXPORT_FIELDS = ["phone", "full_name", "gotram", "address", "mobile", "email", "registered_at"]
+EXPORT_BATCH_SIZE = 1000
+MAX_PAGE_SIZE = 200
+
+# At most this many exports stream at once; each holds one Mongo cursor.
+MAX_CONCURRENT_EXPORTS = 2
+export_slots = threading.BoundedSemaphore(MAX_CONCURRENT_EXPORTS)
+
+
+# =====================================================
+# SEARCH KEYS & INDEXES
+# =====================================================
+
+def search_key(value) -> str:
+    """Lowercased, whitespace-collapsed form used for indexed prefix search."""
+    if not value:
+        return ""
+    return re.sub(r"\s+", " ", str(value)).strip().lower()
+
+
+def search_fields(full_name, gotram) -> dict:
+    return {
+        "name_key": search_key(full_name),
+        "gotram_key": search_key(gotram),
+    }
+
+
+def ensure_devotee_indexes(devotees_collection):
+    devotees_collection.create_index([("name_key", 1), ("_id", 1)])
+    devotees_collection.create_index([("gotram_key", 1), ("name_key", 1), ("_id", 1)])
+    devotees_collection.create_index("mobile")
+    devotees_collection.create_index(
+        [("full_name", "text"), ("gotram", "text"), ("address", "text")],
+        name="devotee_text",
+    )
+
+
+def backfill_search_fields(devotees_collection) -> int:
+    """Adds name_key/gotram_key to devotees registered before they existed."""
+    updated = 0
+    for doc in devotees_collection.find(
+        {"name_key": {"$exists": False}},
+        {"full_name": 1, "gotram": 1},
+    ).batch_size(EXPORT_BATCH_SIZE):
+        devotees_collection.update_one(
+            {"_id": doc["_id"]},
+            {"$set": search_fields(doc.get("full_name"), doc.get("gotram"))}
+        )
+        updated += 1
+    return updated
+
+
+# =====================================================
+# QUERY
+# =====================================================
+
+def encode_cursor(doc, sort_field):
+    token = {"id": str(doc["_id"])}
+    if sort_field:
+        token["k"] = doc.get(sort_field, "")
+    return base64.urlsafe_b64encode(json.dumps(token).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return token.get("k"), ObjectId(token["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def build_query(name=None, gotram=None, mobile=None, text=None):
+    """
+    Returns (query, sort_field). Every combination is served by one of the
+    indexes from ensure_devotee_indexes; results are ordered by
+    (sort_field, _id) so keyset pagination stays on the index.
+    """
+    query = {}
+    sort_field = None
+
+    if gotram:
+        query["gotram_key"] = search_key(gotram)
+
+    if name:
+        prefix = search_key(name)
+        query["name_key"] = {"$gte": prefix, "$lt": prefix + "\uffff"}
+        sort_field = "name_key"
+    elif gotram:
+        sort_field = "name_key"
+
+    if mobile:
+        raw = mobile.strip()
+        variants = {raw, normalize_phone(raw), raw.replace("+", "")}
+        if raw.startswith("91") and len(raw) > 10:
+            variants.add(raw[2:])
+        query["mobile"] = {"$in": sorted(variants)}
+
+    if text:
+        query["$text"] = {"$search": text}
+
+    return query, sort_field
+
+
+def _after(query, sort_field, cursor):
+    key, last_id = decode_cursor(cursor)
+    if not sort_field:
+        return {**query, "_id": {"$gt": last_id}}
+
+    return {
+        "$and": [
+            query,
+            {"$or": [
+                {sort_field: {"$gt": key}},
+                {sort_field: key, "_id": {"$gt": last_id}},
+            ]},
+        ]
+    }
+
+
+def search_devotees(devotees_collection, name=None, gotram=None, mobile=None,
+                    text=None, cursor=None, limit=50):
+    """
+    One page of devotees. Returns {"items": [...], "next_cursor": str|None}.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    query, sort_field = build_query(name, gotram, mobile, text)
+
+    if cursor:
+        query = _after(query, sort_field, cursor)
+
+    sort = [(sort_field, 1), ("_id", 1)] if sort_field else [("_id", 1)]
+
+    docs = list(
+        devotees_collection.find(query).sort(sort).limit(limit + 1)
+    )
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_field)
+
+    return {
+        "items": [serialize_devotee(d) for d in docs],
+        "next_cursor": next_cursor,
+    }
+
+
+def serialize_devotee(doc) -> dict:
+    row = {field: doc.get(field) for field in EXPORT_FIELDS}
+    if row.get("registered_at") is not None:
+        row["registered_at"] = row["registered_at"].isoformat()
+    return row
+
+
+# =====================================================
+# EXPORT (constant memory)
+# =====================================================
+
+def iter_devotees(devotees_collection, name=None, gotram=None, mobile=None, text=None):
+    query, _ = build_query(name, gotram, mobile, text)
+    projection = {field: 1 for field in EXPORT_FIELDS}
+
+    cursor = devotees_collection.find(query, projection).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    try:
+        for doc in cursor:
+            yield serialize_devotee(doc)
+    finally:
+        close = getattr(cursor, "close", None)
+        if close:
+            close()
+
+
+def export_csv(rows, chunk_rows=500):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_jsonl(rows, chunk_rows=500):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) >= chunk_rows:
+            yield "\n".join(lines) + "\n"
+            lines = []
+
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+EXPORTERS = {"csv": export_csv, "jsonl": export_jsonl}
+
+
+class ExportStream:
+    """
+    Iterator of export chunks that holds one export slot until it is
+    exhausted or closed, whichever comes first.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._chunks.close()
+            export_slots.release()
+
+    __del__ = close
+
+
+def stream_export(devotees_collection, fmt="csv", **filters):
+    """Raises RuntimeError if MAX_CONCURRENT_EXPORTS are already running."""
+    if fmt not in EXPORTERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    if not export_slots.acquire(blocking=False):
+        raise RuntimeError("Too many exports running")
+
+    rows = iter_devotees(devotees_collection, **filters)
+    return ExportStream(EXPORTERS[fmt](rows))
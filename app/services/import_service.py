@@ -0,0 +1,231 @@
+import csv
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.services.registration_service import clean_registration
+from app.services.devotee import search_fields
+
+logger = logging.getLogger("TempleBot")
+
+IMPORT_BATCH_SIZE = 1000
+
+# Accepted column names for each devotee field (first match wins).
+COLUMN_ALIASES = {
+    "phone": ["phone", "whatsapp", "whatsapp_phone"],
+    "name": ["full_name", "name", "devotee_name"],
+    "gotram": ["gotram", "gothram"],
+    "address": ["address"],
+    "mobile": ["mobile", "mobile_number", "contact"],
+    "email": ["email", "e-mail"],
+}
+
+
+# =====================================================
+# READING
+# =====================================================
+
+def read_rows(path: str):
+    """Yields (row_number, dict) from a CSV or JSONL file, one row at a time."""
+    if path.endswith(".jsonl") or path.endswith(".ndjson"):
+        with open(path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield number, {"__error__": f"invalid JSON: {e.msg}"}
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            # Row 1 is the header, so data rows start at 2 like in a spreadsheet.
+            for number, row in enumerate(csv.DictReader(f), start=2):
+                yield number, row
+
+
+def _pick(lowered: dict, field: str):
+    for alias in COLUMN_ALIASES[field]:
+        value = lowered.get(alias)
+        if value not in (None, ""):
+            return str(value)
+    return None
+
+
+def to_whatsapp_phone(raw: str) -> str:
+    """
+    Turns a register's phone column into WhatsApp's digits-only format:
+
+    - "+<country><number>" keeps its country code as written.
+    - One leading trunk "0" is dropped ("09876543210" is a local mobile).
+    - Exactly 10 digits is an Indian mobile and gets "91", even if it
+      already starts with 91.
+    - 12 digits starting with 91 is already in WhatsApp's format.
+
+    Anything else is ambiguous and raises ValueError.
+    """
+    phone = "".join(ch for ch in raw if ch.isdigit() or ch == "+")
+
+    if phone.startswith("+"):
+        digits = phone[1:]
+        if digits.isdigit() and 8 <= len(digits) <= 15:
+            return digits
+        raise ValueError(f"invalid phone: {raw}")
+
+    if phone.startswith("0"):
+        phone = phone[1:]
+
+    if phone.isdigit() and len(phone) == 10:
+        return "91" + phone
+    if phone.isdigit() and len(phone) == 12 and phone.startswith("91"):
+        return phone
+
+    raise ValueError(f"invalid phone: {raw}")
+
+
+def to_devotee(row: dict) -> dict:
+    """Validates one input row. Raises ValueError with a readable reason."""
+    if "__error__" in row:
+        raise ValueError(row["__error__"])
+
+    lowered = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+
+    record = clean_registration(
+        _pick(lowered, "name"),
+        _pick(lowered, "gotram"),
+        _pick(lowered, "address"),
+        _pick(lowered, "mobile"),
+        _pick(lowered, "email"),
+    )
+
+    # Paper registers have no WhatsApp number; the mobile is the best key.
+    record["phone"] = to_whatsapp_phone(_pick(lowered, "phone") or record["mobile"])
+    return record
+
+
+# =====================================================
+# CHECKPOINT
+# =====================================================
+
+def checkpoint_path(path: str) -> str:
+    return path + ".progress"
+
+
+def load_checkpoint(path: str) -> int:
+    try:
+        with open(checkpoint_path(path), "r") as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def save_checkpoint(path: str, row_number: int):
+    tmp = checkpoint_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(str(row_number))
+    os.replace(tmp, checkpoint_path(path))
+
+
+# =====================================================
+# IMPORT
+# =====================================================
+
+def _flush(devotees_collection, batch, stats, report_error):
+    """
+    batch is {phone: (row_number, record)}. Upserts are keyed by the unique
+    phone index, so re-running a batch after a crash is harmless.
+    """
+    if not batch:
+        return
+
+    now = datetime.utcnow()
+    rows = list(batch.values())
+    operations = [
+        UpdateOne(
+            {"phone": record["phone"]},
+            {
+                "$set": {
+                    **record,
+                    **search_fields(record["full_name"], record["gotram"]),
+                    "imported_at": now,
+                },
+                "$setOnInsert": {"registered_at": now, "source": "import"},
+            },
+            upsert=True,
+        )
+        for _, record in rows
+    ]
+
+    try:
+        result = devotees_collection.bulk_write(operations, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for error in details.get("writeErrors", []):
+            row_number, record = rows[error["index"]]
+            report_error(row_number, error.get("errmsg", "write failed"), record)
+
+    stats["inserted"] += details.get("nUpserted", 0)
+    stats["updated"] += details.get("nMatched", 0)
+    stats["failed"] += len(details.get("writeErrors", []))
+
+
+def import_devotees(devotees_collection, path: str, resume: bool = False,
+                    batch_size: int = IMPORT_BATCH_SIZE, errors_out=None):
+    """
+    Streams rows from path into devotees. Invalid rows are reported and
+    skipped; nothing aborts the run. With resume=True, rows up to the last
+    checkpoint are skipped.
+    """
+    start_after = load_checkpoint(path) if resume else 0
+    stats = {"read": 0, "skipped": 0, "inserted": 0, "updated": 0,
+             "invalid": 0, "failed": 0, "merged": 0}
+
+    def report_error(row_number, reason, row):
+        if errors_out is not None:
+            errors_out.write(json.dumps(
+                {"row": row_number, "error": reason, "data": row},
+                ensure_ascii=False, default=str,
+            ) + "\n")
+
+    batch = {}
+    last_row = start_after
+    started = time.perf_counter()
+
+    for row_number, row in read_rows(path):
+        if row_number <= start_after:
+            stats["skipped"] += 1
+            continue
+
+        stats["read"] += 1
+        last_row = row_number
+
+        try:
+            record = to_devotee(row)
+        except ValueError as e:
+            stats["invalid"] += 1
+            report_error(row_number, str(e), row)
+            continue
+
+        # Later rows for the same phone win, as they would sequentially.
+        if record["phone"] in batch:
+            stats["merged"] += 1
+        batch[record["phone"]] = (row_number, record)
+
+        if len(batch) >= batch_size:
+            _flush(devotees_collection, batch, stats, report_error)
+            save_checkpoint(path, last_row)
+            batch = {}
+
+    _flush(devotees_collection, batch, stats, report_error)
+    save_checkpoint(path, last_row)
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    stats["rows_per_sec"] = round(stats["read"] / stats["seconds"]) if stats["seconds"] else 0
+    logger.info(f"Devotee import finished: {stats}")
+    return stats
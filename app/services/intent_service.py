@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+logger = logging.getLogger("TempleBot")
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+# Longer messages are free text, not commands; leave them unmatched.
+MAX_TOKENS = 8
+# Shorter words are too easy to confuse with each other to correct.
+MIN_FUZZY_LENGTH = 4
+FUZZY_WEIGHT = 0.75
+
+# Intents that change a devotee's state act only when the message is
+# mostly the keyword itself; "I can't read telugu" or "I don't want to
+# register" must not switch the language or start a registration. When
+# the message is not clear enough, the main menu is shown instead, so the
+# option is one tap away.
+STATEFUL_INTENTS = {"lang_tel", "lang_en", "register"}
+# Share of the non-filler words that must be keyword matches.
+STATEFUL_MIN_COVERAGE = 0.6
+FILLER_WORDS = {
+    "i", "me", "my", "to", "want", "please", "pls", "plz", "now", "ok", "okay",
+    "sir", "ji", "garu", "change", "switch", "language", "cheyandi", "cheyyandi",
+    "kavali", "lo", "చేయండి", "కావాలి", "భాష",
+}
+# Normalizing splits "don't" into "don t", so "t" catches every n't form.
+NEGATIONS = {
+    "not", "no", "never", "cannot", "t", "dont", "cant", "wont", "didnt", "doesnt",
+    "vaddu", "vaddhu", "kadu", "ledu", "radu", "raadu", "వద్దు", "కాదు", "లేదు", "రాదు",
+}
+
+# Letters, digits and the Telugu block (vowel signs are not \w).
+_NON_WORD = re.compile(r"[^\w\u0c00-\u0c7f]+")
+_END = None
+
+INTENTS = {}
+
+try:
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(BASE_DIR, "data", "intents.json"), "r", encoding="utf-8") as f:
+        INTENTS = json.load(f)
+except Exception as e:
+    logger.error(f"Intent keywords load failed: {e}")
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFC", text).lower()
+    return _NON_WORD.sub(" ", text).replace("_", " ").strip()
+
+
+def max_distance(word: str) -> int:
+    return 1 if len(word) < 8 else 2
+
+
+def _deletes(word: str, distance: int) -> set:
+    """`word` with up to `distance` characters removed (SymSpell)."""
+    found = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        found |= frontier
+    return found
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance, computed only within `limit` of the
+    diagonal; returns limit + 1 once it is exceeded.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    over = limit + 1
+    previous2 = None
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        row_min = current[0]
+        for j in range(low, high + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return over
+        previous2, previous = previous, current
+    return min(previous[-1], over)
+
+
+# =====================================================
+# INDEX (built once at import)
+# =====================================================
+
+def build_index(intents: dict):
+    """
+    Returns (trie, words, deletes): a token trie of every keyword phrase,
+    single-word keywords -> intent, and the delete-variant index used for
+    typo matching.
+    """
+    trie = {}
+    words = {}
+    deletes = defaultdict(set)
+
+    for intent, phrases in intents.items():
+        for phrase in phrases:
+            tokens = normalize(phrase).split()
+            if not tokens:
+                continue
+
+            node = trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[_END] = intent
+
+            if len(tokens) == 1 and len(tokens[0]) >= MIN_FUZZY_LENGTH:
+                word = tokens[0]
+                words[word] = intent
+                for variant in _deletes(word, max_distance(word)):
+                    deletes[variant].add(word)
+
+    return trie, words, dict(deletes)
+
+
+_trie, _words, _delete_index = build_index(INTENTS)
+
+
+# =====================================================
+# MATCHING
+# =====================================================
+
+@lru_cache(maxsize=4096)
+def fuzzy_intent(token: str):
+    """Intent of the closest keyword within edit distance, if unambiguous."""
+    if len(token) < MIN_FUZZY_LENGTH:
+        return None
+
+    limit = max_distance(token)
+    candidates = set()
+    for variant in _deletes(token, limit):
+        candidates.update(_delete_index.get(variant, ()))
+
+    best, best_distance = set(), limit + 1
+    for word in candidates:
+        distance = edit_distance(token, word, min(limit, max_distance(word)))
+        if distance < best_distance:
+            best, best_distance = {_words[word]}, distance
+        elif distance == best_distance:
+            best.add(_words[word])
+
+    if best_distance <= limit and len(best) == 1:
+        return best.pop()
+    return None
+
+
+def match_intent(text: str):
+    """
+    Maps a short free-text message to a menu intent, or None.
+
+    Exact keyword phrases (longest first) score one point per word and
+    typo matches score FUZZY_WEIGHT; the highest total wins and ties match
+    nothing. Words outside the index are ignored, except that a
+    STATEFUL_INTENTS match falls back to "menu" unless it is clear.
+    """
+    tokens = normalize(text).split()
+    if not tokens or len(tokens) > MAX_TOKENS:
+        return None
+
+    scores = defaultdict(float)
+    matched_words = defaultdict(int)
+    i = 0
+    while i < len(tokens):
+        node, j, matched = _trie, i, None
+        while j < len(tokens) and tokens[j] in node:
+            node = node[tokens[j]]
+            j += 1
+            if _END in node:
+                matched = (j, node[_END])
+
+        if matched:
+            end, intent = matched
+            scores[intent] += end - i
+            matched_words[intent] += end - i
+            i = end
+            continue
+
+        intent = fuzzy_intent(tokens[i])
+        if intent:
+            scores[intent] += FUZZY_WEIGHT
+            matched_words[intent] += 1
+        i += 1
+
+    if not scores:
+        return None
+
+    ranked = sorted(scores.items(), key=lambda kv: -kv[1])
+    if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+        return None
+
+    intent = ranked[0][0]
+    if intent in STATEFUL_INTENTS and not _is_clear(tokens, matched_words[intent]):
+        return "menu"
+    return intent
+
+
+def _is_clear(tokens: list, keyword_words: int) -> bool:
+    if any(token in NEGATIONS for token in tokens):
+        return False
+    content = sum(1 for token in tokens if token not in FILLER_WORDS)
+    return keyword_words >= STATEFUL_MIN_COVERAGE * max(content, 1)
@@ -0,0 +1,192 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+from app.services import whatsapp_service
+from app.services.coordination import acquire_lock, release_lock
+from app.services.whatsapp_service import send_image, send_image_by_id, upload_media
+
+logger = logging.getLogger("TempleBot")
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+MEDIA_CACHE_ENABLED = os.getenv("MEDIA_CACHE_ENABLED", "true").lower() == "true"
+
+# WhatsApp keeps uploaded media for 30 days; refresh well before that.
+MEDIA_TTL = timedelta(days=29)
+REFRESH_MARGIN = timedelta(days=3)
+
+# Static assets sent by the bot: key -> (public url, filename, mime type)
+MEDIA_ASSETS = {
+    "history_tel": (
+        "https://pub-d1d3a6c8900e4412aac6397524edd899.r2.dev/SPJRSD%20Temple%20History%20TEL%20(1).PNG",
+        "temple_history_tel.png",
+        "image/png",
+    ),
+    "history_en": (
+        "https://pub-d1d3a6c8900e4412aac6397524edd899.r2.dev/SPJRSD%20Temple%20History%20ENG%20(1).PNG",
+        "temple_history_en.png",
+        "image/png",
+    ),
+}
+
+media_cache = None
+locks = None
+
+# asset key -> {"media_id", "expires_at"}; avoids a Mongo read per send.
+_local = {}
+_refreshing = set()
+_state_lock = threading.Lock()
+_uploader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="media-upload")
+
+
+def init_media(media_cache_collection, locks_collection):
+    global media_cache, locks
+    media_cache = media_cache_collection
+    locks = locks_collection
+    media_cache.create_index("asset_key", unique=True)
+    media_cache.create_index("media_id")
+    whatsapp_service.media_failure_handler = invalidate_media_id
+
+
+# =====================================================
+# CACHE
+# =====================================================
+
+def _load(asset_key):
+    doc = media_cache.find_one({"asset_key": asset_key, "invalid": {"$ne": True}})
+    if not doc or not doc.get("media_id"):
+        return None
+    return {"media_id": doc["media_id"], "expires_at": doc["expires_at"]}
+
+
+def get_media_id(asset_key: str):
+    """
+    Cached media id for an asset, or None if there is no usable one yet.
+    Never uploads inline: missing or expiring ids are refreshed in the
+    background while the caller falls back to the public link.
+    """
+    if media_cache is None or not MEDIA_CACHE_ENABLED:
+        return None
+
+    now = datetime.utcnow()
+    entry = _local.get(asset_key)
+
+    if entry is None or entry["expires_at"] - now < REFRESH_MARGIN:
+        # Another worker may already have refreshed it.
+        entry = _load(asset_key)
+        with _state_lock:
+            if entry:
+                _local[asset_key] = entry
+            else:
+                _local.pop(asset_key, None)
+
+    if entry is None or entry["expires_at"] <= now:
+        schedule_refresh(asset_key)
+        return None
+
+    if entry["expires_at"] - now < REFRESH_MARGIN:
+        schedule_refresh(asset_key)
+
+    return entry["media_id"]
+
+
+def schedule_refresh(asset_key: str):
+    with _state_lock:
+        if asset_key in _refreshing:
+            return
+        _refreshing.add(asset_key)
+    _uploader.submit(refresh_media, asset_key)
+
+
+def refresh_media(asset_key: str):
+    """Downloads the asset once and uploads it to WhatsApp media."""
+    try:
+        if not acquire_lock(locks, f"media_upload:{asset_key}", ttl_seconds=120):
+            return None
+
+        try:
+            current = _load(asset_key)
+            if current and current["expires_at"] - datetime.utcnow() >= REFRESH_MARGIN:
+                with _state_lock:
+                    _local[asset_key] = current
+                return current["media_id"]
+
+            url, filename, mime_type = MEDIA_ASSETS[asset_key]
+            download = requests.get(url, timeout=60)
+            download.raise_for_status()
+
+            media_id = upload_media(download.content, filename, mime_type)
+            uploaded_at = datetime.utcnow()
+            entry = {"media_id": media_id, "expires_at": uploaded_at + MEDIA_TTL}
+
+            media_cache.update_one(
+                {"asset_key": asset_key},
+                {"$set": {
+                    **entry,
+                    "url": url,
+                    "uploaded_at": uploaded_at,
+                    "invalid": False,
+                }},
+                upsert=True,
+            )
+
+            with _state_lock:
+                _local[asset_key] = entry
+
+            logger.info(f"Uploaded media {asset_key} as {media_id}")
+            return media_id
+
+        finally:
+            release_lock(locks, f"media_upload:{asset_key}")
+
+    except Exception as e:
+        logger.error(f"Media refresh failed for {asset_key}: {e}")
+        return None
+
+    finally:
+        with _state_lock:
+            _refreshing.discard(asset_key)
+
+
+def invalidate_media_id(media_id: str):
+    """Called when Meta rejects a cached id; forces a fresh upload."""
+    doc = media_cache.find_one_and_update(
+        {"media_id": media_id},
+        {"$set": {"invalid": True}},
+    )
+
+    with _state_lock:
+        for key, entry in list(_local.items()):
+            if entry["media_id"] == media_id:
+                del _local[key]
+
+    if doc:
+        logger.warning(f"Media id {media_id} for {doc['asset_key']} invalidated")
+        schedule_refresh(doc["asset_key"])
+
+
+# =====================================================
+# SENDING
+# =====================================================
+
+def send_cached_image(phone: str, asset_key: str, caption: str):
+    url = MEDIA_ASSETS[asset_key][0]
+    media_id = get_media_id(asset_key)
+
+    if media_id:
+        return send_image_by_id(phone, media_id, caption, fallback_link=url)
+
+    return send_image(phone, url, caption)
+
+
+def warm_media_cache():
+    """Uploads any missing or expiring assets; run once at startup."""
+    for asset_key in MEDIA_ASSETS:
+        get_media_id(asset_key)
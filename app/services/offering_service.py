@@ -0,0 +1,342 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from app.services.whatsapp_service import send_text
+from app.services.coordination import acquire_lock
+from app.services.analytics_service import record_event
+from app.services.resilience_service import remaining
+
+logger = logging.getLogger("TempleBot")
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
+RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET")
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+
+OFFERING_EXPIRY = timedelta(hours=24)
+RECONCILE_MIN_AGE = timedelta(minutes=2)
+RECONCILE_INTERVAL_SECONDS = int(os.getenv("RAZORPAY_RECONCILE_SECONDS", "300"))
+RAZORPAY_PAGE_SIZE = 100
+
+SEVAS = {}
+
+try:
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(BASE_DIR, "data", "sevas.json"), "r", encoding="utf-8") as f:
+        SEVAS = {seva["seva_id"]: seva for seva in json.load(f)}
+except Exception as e:
+    logger.error(f"Seva catalogue load failed: {e}")
+
+# The Razorpay SDK is synchronous; keep its network calls off the event loop.
+_razorpay_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="razorpay")
+
+razorpay_client = None
+offerings = None
+bookings = None
+payment_events = None
+
+
+def init_offerings(client, offerings_collection, bookings_collection, events_collection):
+    global razorpay_client, offerings, bookings, payment_events
+    razorpay_client = client
+    offerings = offerings_collection
+    bookings = bookings_collection
+    payment_events = events_collection
+
+    offerings.create_index("razorpay_order_id", unique=True, sparse=True)
+    offerings.create_index([("status", 1), ("created_at", 1)])
+    bookings.create_index("offering_id", unique=True)
+    bookings.create_index("created_at")
+    payment_events.create_index("event_id", unique=True)
+
+
+def offerings_enabled() -> bool:
+    # Without a public base URL the checkout link would be relative and dead.
+    return razorpay_client is not None and offerings is not None and bool(SEVAS) and bool(PUBLIC_BASE_URL)
+
+
+def payment_url(offering_id: str) -> str:
+    return f"{PUBLIC_BASE_URL}/pay/{offering_id}"
+
+
+# =====================================================
+# ORDER CREATION
+# =====================================================
+
+async def _razorpay_call(func, *args):
+    """
+    Runs an SDK call in the pool, bounded by the webhook's remaining budget.
+    A timeout only stops the wait; a call already running still finishes.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_razorpay_executor, func, *args)
+    return await asyncio.wait_for(future, timeout=remaining())
+
+
+def _create_order(offering_id: str, data: dict) -> dict:
+    """
+    Creates the order and records it on the offering, both in the pool
+    thread, so an order that completes after the webhook stopped waiting
+    is still tracked (and later paid or expired) rather than orphaned.
+    """
+    try:
+        order = razorpay_client.order.create(data)
+    except Exception as e:
+        # The order may still exist if only the response was lost; the
+        # reconciler finds it by receipt.
+        offerings.update_one(
+            {"offering_id": offering_id, "status": "creating"},
+            {"$set": {"status": "failed", "error": str(e)[:300]}}
+        )
+        raise
+
+    offerings.update_one(
+        {"offering_id": offering_id, "status": {"$in": ["creating", "failed"]}},
+        {"$set": {"status": "pending", "razorpay_order_id": order["id"]}, "$unset": {"error": ""}}
+    )
+    return order
+
+
+async def create_offering(phone: str, seva_id: str) -> dict:
+    """
+    Records the offering, then creates its Razorpay order in the thread
+    pool. Returns the offering document; raises if the order could not be
+    created within the request budget.
+    """
+    seva = SEVAS[seva_id]
+    offering_id = uuid.uuid4().hex[:16]
+    amount_paise = int(seva["amount_inr"] * 100)
+    now = datetime.utcnow()
+
+    offering = {
+        "offering_id": offering_id,
+        "phone": phone,
+        "seva_id": seva_id,
+        "amount": amount_paise,
+        "currency": "INR",
+        "status": "creating",
+        "created_at": now,
+    }
+    offerings.insert_one(offering)
+
+    order = await _razorpay_call(_create_order, offering_id, {
+        "amount": amount_paise,
+        "currency": "INR",
+        "receipt": offering_id,
+        "notes": {"phone": phone, "seva_id": seva_id},
+    })
+
+    offering.update(status="pending", razorpay_order_id=order["id"])
+    return offering
+
+
+# =====================================================
+# PAYMENT CAPTURE (idempotent)
+# =====================================================
+
+def _flip_to_paid(offering_id: str, payment_id: str, source: str, now: datetime):
+    offerings.update_one(
+        {"offering_id": offering_id, "status": {"$ne": "paid"}},
+        {"$set": {
+            "status": "paid",
+            "razorpay_payment_id": payment_id,
+            "paid_at": now,
+            "paid_via": source,
+        }},
+    )
+
+
+def mark_paid(order_id: str, payment_id: str, source: str):
+    """
+    Books an offering exactly once, whether the webhook, a webhook retry
+    or the reconciler gets there first. Returns True if this call made
+    the booking.
+
+    The booking insert (unique on offering_id) is the guard and comes
+    before the status flip: a crash in between leaves a pending offering
+    that already has its booking, and the next webhook retry or
+    reconciler pass only completes the flip.
+    """
+    offering = offerings.find_one({"razorpay_order_id": order_id})
+    if not offering:
+        logger.warning(f"Payment {payment_id} for unknown Razorpay order {order_id}")
+        return False
+
+    now = datetime.utcnow()
+    booking_id = f"BK{offering['offering_id'][:10].upper()}"
+    try:
+        bookings.insert_one({
+            "booking_id": booking_id,
+            "offering_id": offering["offering_id"],
+            "phone": offering["phone"],
+            "seva_id": offering["seva_id"],
+            "amount": offering["amount"],
+            "razorpay_payment_id": payment_id,
+            "created_at": now,
+        })
+    except DuplicateKeyError:
+        _flip_to_paid(offering["offering_id"], payment_id, source, now)
+        logger.info(f"Offering {offering['offering_id']} already booked; {source} payment ignored")
+        return False
+
+    _flip_to_paid(offering["offering_id"], payment_id, source, now)
+    record_event("seva_booked")
+
+    seva = SEVAS.get(offering["seva_id"], {})
+    send_text(
+        offering["phone"],
+        f"🙏 Payment received for {seva.get('name_en', offering['seva_id'])}.\n"
+        f"Booking ID: {booking_id}\nAmount: ₹{offering['amount'] / 100:.0f}"
+    )
+    logger.info(f"Offering {offering['offering_id']} paid via {source}")
+    return True
+
+
+def verify_razorpay_signature(body: bytes, signature: str) -> bool:
+    if not RAZORPAY_WEBHOOK_SECRET or not signature:
+        return False
+    expected = hmac.new(RAZORPAY_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def handle_payment_event(event_id: str, event: dict) -> str:
+    """
+    Processes one verified Razorpay webhook event. Razorpay retries until
+    it gets a 2xx, so the event id is recorded only after processing;
+    mark_paid itself is idempotent if a retry races the original.
+    """
+    if event_id and payment_events.find_one({"event_id": event_id}):
+        return "duplicate"
+
+    name = event.get("event")
+    payload = event.get("payload", {})
+    payment = payload.get("payment", {}).get("entity", {})
+    order = payload.get("order", {}).get("entity", {})
+    order_id = payment.get("order_id") or order.get("id")
+
+    if name not in ("payment.captured", "order.paid") or not order_id:
+        status = "ignored"
+    elif mark_paid(order_id, payment.get("id"), "webhook"):
+        status = "paid"
+    else:
+        status = "already_processed"
+
+    if event_id:
+        try:
+            payment_events.insert_one({"event_id": event_id, "event": name, "received_at": datetime.utcnow()})
+        except DuplicateKeyError:
+            pass
+
+    return status
+
+
+# =====================================================
+# RECONCILER
+# =====================================================
+
+def _fetch_orders_since(since: datetime):
+    """Pages through Razorpay orders created since `since`, 100 per call."""
+    skip = 0
+    start_ts = int((since - datetime(1970, 1, 1)).total_seconds())
+
+    while True:
+        page = razorpay_client.order.all({"from": start_ts, "count": RAZORPAY_PAGE_SIZE, "skip": skip})
+        items = page.get("items", [])
+        yield from items
+        if len(items) < RAZORPAY_PAGE_SIZE:
+            return
+        skip += RAZORPAY_PAGE_SIZE
+
+
+def reconcile_pending() -> dict:
+    """
+    Catches payments whose webhook never arrived. Fetches order status in
+    bulk (one API call per 100 orders) instead of one call per offering.
+    Offerings whose order creation never reported back ("creating", or
+    "failed" on a lost response) are matched to their order by receipt,
+    and offerings left unpaid after their booking was written are fixed.
+    """
+    now = datetime.utcnow()
+    stats = {"checked": 0, "recovered": 0, "paid": 0, "repaired": 0, "expired": 0, "abandoned": 0}
+
+    # Booked, but the status flip after the booking never happened.
+    booked = [b["offering_id"] for b in bookings.find(
+        {"created_at": {"$gt": now - 2 * OFFERING_EXPIRY}}, {"offering_id": 1}
+    )]
+    if booked:
+        result = offerings.update_many(
+            {"offering_id": {"$in": booked}, "status": {"$ne": "paid"}},
+            {"$set": {"status": "paid", "paid_at": now, "paid_via": "reconciler"}},
+        )
+        stats["repaired"] = result.modified_count
+
+    pending, unlinked = {}, {}
+    for doc in offerings.find({
+        "status": {"$in": ["pending", "creating", "failed"]},
+        "created_at": {"$lt": now - RECONCILE_MIN_AGE, "$gt": now - 2 * OFFERING_EXPIRY},
+    }):
+        if doc.get("razorpay_order_id"):
+            pending[doc["razorpay_order_id"]] = doc
+        else:
+            unlinked[doc["offering_id"]] = doc
+
+    if pending or unlinked:
+        oldest = min(doc["created_at"] for doc in [*pending.values(), *unlinked.values()])
+        for order in _fetch_orders_since(oldest - timedelta(minutes=5)):
+            if order["id"] not in pending:
+                if order.get("receipt") not in unlinked:
+                    continue
+                offerings.update_one(
+                    {"offering_id": order["receipt"], "status": {"$in": ["creating", "failed"]}},
+                    {"$set": {"status": "pending", "razorpay_order_id": order["id"]}, "$unset": {"error": ""}}
+                )
+                stats["recovered"] += 1
+            stats["checked"] += 1
+            if order.get("status") == "paid":
+                payments = razorpay_client.order.payments(order["id"]).get("items", [])
+                captured = next((p["id"] for p in payments if p.get("status") == "captured"), None)
+                if mark_paid(order["id"], captured, "reconciler"):
+                    stats["paid"] += 1
+
+    result = offerings.update_many(
+        {"status": "pending", "created_at": {"$lt": now - OFFERING_EXPIRY}},
+        {"$set": {"status": "expired"}}
+    )
+    stats["expired"] = result.modified_count
+
+    # No order ever turned up for these, so there is nothing to pay.
+    result = offerings.update_many(
+        {"status": "creating", "razorpay_order_id": {"$exists": False}, "created_at": {"$lt": now - OFFERING_EXPIRY}},
+        {"$set": {"status": "failed", "error": "order not created"}}
+    )
+    stats["abandoned"] = result.modified_count
+
+    if any(stats.values()):
+        logger.info(f"Razorpay reconciliation: {stats}")
+    return stats
+
+
+async def reconcile_forever(locks_collection):
+    """
+    Background loop started by main.py. The lease is held for the whole
+    interval so only one worker reconciles per period.
+    """
+    while True:
+        await asyncio.sleep(RECONCILE_INTERVAL_SECONDS)
+        try:
+            if acquire_lock(locks_collection, "razorpay_reconcile", ttl_seconds=RECONCILE_INTERVAL_SECONDS - 5):
+                await _razorpay_call(reconcile_pending)
+        except Exception:
+            logger.exception("Razorpay reconciliation failed")
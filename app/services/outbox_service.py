@@ -0,0 +1,333 @@
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.services.coordination import WORKER_ID
+from app.services.whatsapp_service import deliver, is_media_error, report_media_failure
+from app.services.resilience_service import CircuitOpenError, graph_breaker
+
+logger = logging.getLogger("TempleBot")
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "false").lower() == "true"
+# Without OUTBOX_ENABLED, still queue the replies the Graph API could not take.
+OUTBOX_DEFER_ON_FAILURE = os.getenv("OUTBOX_DEFER_ON_FAILURE", "true").lower() == "true"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "8"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1.0"))
+OUTBOX_SEND_TIMEOUT = float(os.getenv("OUTBOX_SEND_TIMEOUT", "10"))
+
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 300
+LEASE_SECONDS = 60
+SENT_RETENTION_SECONDS = 7 * 86400
+
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def is_retryable(status_code) -> bool:
+    """Network errors (None), throttling and server errors are retried."""
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+# =====================================================
+# OUTBOX
+# =====================================================
+
+class Outbox:
+    """
+    Durable queue of Graph API payloads.
+
+    Handlers enqueue through whatsapp_request(); a dispatcher thread claims
+    due messages, sends them over pooled connections and retries failures
+    with exponential backoff. Messages to the same recipient are delivered
+    strictly in order: only the oldest unfinished message per recipient
+    carries `head`, and the flag moves to the next one once it has been
+    sent or dead-lettered, so claiming reads heads only and one recipient's
+    backlog cannot crowd out everyone else.
+    """
+
+    def __init__(self, outbox_collection, dead_letter_collection):
+        self.outbox = outbox_collection
+        self.dead_letters = dead_letter_collection
+        self.counters = {"enqueued": 0, "sent": 0, "retried": 0, "postponed": 0, "dead_lettered": 0}
+        self._counter_lock = threading.Lock()
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = ThreadPoolExecutor(max_workers=OUTBOX_CONCURRENCY, thread_name_prefix="outbox")
+
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OUTBOX_CONCURRENCY)
+        self._http.mount("https://", adapter)
+        self._http.mount("http://", adapter)
+
+    def _count(self, name):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def ensure_indexes(self):
+        self.outbox.create_index([("status", 1), ("next_attempt_at", 1)])
+        self.outbox.create_index([("head", 1), ("status", 1), ("next_attempt_at", 1)])
+        self.outbox.create_index([("to", 1), ("_id", 1)])
+        self.outbox.create_index("sent_at", expireAfterSeconds=SENT_RETENTION_SECONDS)
+        self.dead_letters.create_index("to")
+
+        # Messages queued before heads existed: elect one per recipient.
+        unflagged = {
+            doc["to"] for doc in self.outbox.find(
+                {"status": {"$in": ["pending", "sending"]}, "head": {"$exists": False}}, {"to": 1}
+            )
+        }
+        for to in unflagged:
+            self._promote(to)
+
+    # -------------------------------------------------
+    # PRODUCER
+    # -------------------------------------------------
+
+    def enqueue(self, payload: dict, fallback: dict = None):
+        """fallback is sent instead if Meta permanently rejects payload."""
+        now = datetime.utcnow()
+        doc = {
+            "to": payload.get("to"),
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+        }
+        if fallback:
+            doc["fallback"] = fallback
+        result = self.outbox.insert_one(doc)
+        # Checked after the insert: if the message ahead finishes meanwhile,
+        # its _promote() sees this one, so some path always sets the flag.
+        if self._is_head_of_queue(doc):
+            self.outbox.update_one({"_id": result.inserted_id}, {"$set": {"head": True}})
+        self._count("enqueued")
+        self._wake.set()
+        return result
+
+    # -------------------------------------------------
+    # CLAIMING
+    # -------------------------------------------------
+
+    def _is_head_of_queue(self, doc) -> bool:
+        earlier = self.outbox.find_one(
+            {"to": doc["to"], "_id": {"$lt": doc["_id"]}, "status": {"$in": ["pending", "sending"]}},
+            {"_id": 1},
+        )
+        return earlier is None
+
+    def has_unfinished(self, to) -> bool:
+        """True while `to` has a message queued by any worker."""
+        return self.outbox.find_one(
+            {"to": to, "status": {"$in": ["pending", "sending"]}}, {"_id": 1}
+        ) is not None
+
+    def _promote(self, to):
+        """Flags the oldest unfinished message for `to` as its queue head."""
+        head = self.outbox.find_one(
+            {"to": to, "status": {"$in": ["pending", "sending"]}},
+            {"_id": 1},
+            sort=[("_id", 1)],
+        )
+        if head:
+            self.outbox.update_one({"_id": head["_id"]}, {"$set": {"head": True}})
+
+    def claim_batch(self, limit: int = OUTBOX_BATCH_SIZE):
+        now = datetime.utcnow()
+        due = self.outbox.find(
+            {"head": True, "$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                # Lease expired: the worker that claimed it died mid-send.
+                {"status": "sending", "lease_until": {"$lt": now}},
+            ]},
+            {"_id": 1, "to": 1, "status": 1},
+        ).sort("_id", 1).limit(limit)
+
+        claimed = []
+        recipients = set()
+
+        for doc in due:
+            if len(claimed) >= limit:
+                break
+            if doc["to"] in recipients:
+                continue
+
+            taken = self.outbox.find_one_and_update(
+                {"_id": doc["_id"], "status": doc["status"]},
+                {"$set": {
+                    "status": "sending",
+                    "claimed_by": WORKER_ID,
+                    "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+                }},
+                return_document=True,
+            )
+            if taken:
+                claimed.append(taken)
+                recipients.add(taken["to"])
+
+        return claimed
+
+    # -------------------------------------------------
+    # SENDING
+    # -------------------------------------------------
+
+    def _postpone(self, doc, seconds):
+        """Puts a claimed message back without spending one of its attempts."""
+        self.outbox.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"status": "pending", "next_attempt_at": datetime.utcnow() + timedelta(seconds=seconds)},
+             "$unset": {"lease_until": "", "claimed_by": ""}},
+        )
+        self._count("postponed")
+
+    def _send_one(self, doc):
+        status_code, error, media_error = None, None, False
+        try:
+            response = deliver(doc["payload"], http=self._http, timeout=OUTBOX_SEND_TIMEOUT)
+            status_code = response.status_code
+            if status_code < 300:
+                self.outbox.update_one(
+                    {"_id": doc["_id"]},
+                    {"$set": {"status": "sent", "sent_at": datetime.utcnow(), "attempts": doc["attempts"] + 1},
+                     "$unset": {"head": "", "lease_until": "", "claimed_by": ""}},
+                )
+                self._promote(doc["to"])
+                self._count("sent")
+                return
+            error = response.text[:500]
+            media_error = is_media_error(response)
+        except CircuitOpenError:
+            # Meta is known to be down; waiting is not the message's fault.
+            self._postpone(doc, max(graph_breaker.retry_in(), 1.0))
+            return
+        except requests.RequestException as e:
+            error = str(e)
+
+        attempts = doc["attempts"] + 1
+
+        if not is_retryable(status_code) and doc.get("fallback"):
+            self._use_fallback(doc, status_code, error, media_error)
+            return
+
+        if not is_retryable(status_code) or attempts >= OUTBOX_MAX_ATTEMPTS:
+            self.dead_letter(doc, attempts, status_code, error)
+            return
+
+        self.outbox.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {
+                "status": "pending",
+                "attempts": attempts,
+                "last_error": error,
+                "last_status": status_code,
+                "next_attempt_at": datetime.utcnow() + timedelta(seconds=backoff_seconds(attempts)),
+            }, "$unset": {"lease_until": "", "claimed_by": ""}},
+        )
+        self._count("retried")
+        logger.warning(f"Outbox send to {doc['to']} failed ({status_code}); retry {attempts}")
+
+    def _use_fallback(self, doc, status_code, error, media_error):
+        if media_error:
+            report_media_failure(doc["payload"].get("image", {}).get("id"))
+        self.outbox.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {
+                "status": "pending",
+                "payload": doc["fallback"],
+                "next_attempt_at": datetime.utcnow(),
+                "last_error": error,
+                "last_status": status_code,
+            }, "$unset": {"fallback": "", "lease_until": "", "claimed_by": ""}},
+        )
+        logger.warning(f"Outbox payload to {doc['to']} rejected ({status_code}); sending fallback")
+
+    def dead_letter(self, doc, attempts, status_code, error):
+        self.dead_letters.insert_one({
+            "to": doc["to"],
+            "payload": doc["payload"],
+            "attempts": attempts,
+            "last_status": status_code,
+            "last_error": error,
+            "created_at": doc["created_at"],
+            "dead_at": datetime.utcnow(),
+        })
+        self.outbox.delete_one({"_id": doc["_id"]})
+        self._promote(doc["to"])
+        self._count("dead_lettered")
+        logger.error(f"Outbox message to {doc['to']} dead-lettered after {attempts} attempts: {status_code} {error}")
+
+    def dispatch_once(self) -> int:
+        if graph_breaker.is_open():
+            return 0
+        batch = self.claim_batch()
+        if batch:
+            list(self._pool.map(self._send_one, batch))
+        return len(batch)
+
+    # -------------------------------------------------
+    # BACKGROUND THREAD
+    # -------------------------------------------------
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.dispatch_once()
+            except Exception:
+                logger.exception("Outbox dispatch error")
+                sent = 0
+
+            if not sent:
+                self._wake.wait(OUTBOX_POLL_SECONDS)
+                self._wake.clear()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info("Outbox dispatcher started.")
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._pool.shutdown(wait=True)
+
+    # -------------------------------------------------
+    # METRICS
+    # -------------------------------------------------
+
+    def metrics(self) -> dict:
+        oldest = self.outbox.find_one(
+            {"status": {"$in": ["pending", "sending"]}},
+            {"created_at": 1},
+            sort=[("_id", 1)],
+        )
+        lag = (datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0.0
+
+        return {
+            "pending": self.outbox.count_documents({"status": "pending"}),
+            "sending": self.outbox.count_documents({"status": "sending"}),
+            "dead_letters": self.dead_letters.count_documents({}),
+            "lag_seconds": round(lag, 3),
+            **{f"{name}_total": value for name, value in self.counters.items()},
+        }
@@ -0,0 +1,255 @@
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from app.services.coordination import WORKER_ID
+
+logger = logging.getLogger("TempleBot")
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+SLOW_REQUEST_BUFFER = int(os.getenv("SLOW_REQUEST_BUFFER", "50"))
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = 60
+# How often idle workers look for a profiling run started elsewhere.
+PROFILE_POLL_SECONDS = 2.0
+
+# =====================================================
+# PER-STAGE REQUEST TIMINGS
+# =====================================================
+
+_current = contextvars.ContextVar("webhook_trace", default=None)
+_slow_requests = deque(maxlen=SLOW_REQUEST_BUFFER)
+_NOOP = nullcontext()
+
+
+class RequestTrace:
+    """Stage timings for one webhook request, in the order they ran."""
+
+    __slots__ = ("started", "stages", "info")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.info = {}
+
+
+class _Stage:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.trace.stages.append((self.name, (time.perf_counter() - self.start) * 1000))
+        return False
+
+
+def begin_trace() -> RequestTrace:
+    trace = RequestTrace()
+    _current.set(trace)
+    return trace
+
+
+def stage(name: str):
+    """Times a block as part of the current webhook request, if any."""
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return _Stage(trace, name)
+
+
+def annotate(**info):
+    trace = _current.get()
+    if trace is not None:
+        trace.info.update(info)
+
+
+def end_trace(trace: RequestTrace):
+    _current.set(None)
+    total_ms = (time.perf_counter() - trace.started) * 1000
+    if total_ms < SLOW_REQUEST_MS:
+        return
+
+    _slow_requests.append({
+        "at": datetime.utcnow().isoformat(timespec="milliseconds") + "Z",
+        "worker": WORKER_ID,
+        "total_ms": round(total_ms, 1),
+        **trace.info,
+        "stages": [{"stage": name, "ms": round(ms, 1)} for name, ms in trace.stages],
+    })
+
+
+def slow_requests() -> list:
+    """Recent slow requests on this worker, slowest first."""
+    return sorted(_slow_requests, key=lambda r: -r["total_ms"])
+
+
+# =====================================================
+# SAMPLING PROFILER
+# =====================================================
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval_ms: float = None) -> Counter:
+    """
+    Samples every thread's stack for `seconds` and returns collapsed
+    stacks ("thread;outer;...;inner" -> samples), the input format of
+    flamegraph.pl and speedscope. Nothing runs outside this call.
+    """
+    interval = (interval_ms or PROFILE_INTERVAL_MS) / 1000
+    me = threading.get_ident()
+    stacks = Counter()
+    deadline = time.perf_counter() + seconds
+
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+
+    return stacks
+
+
+def collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# =====================================================
+# PROFILING ACROSS WORKERS
+# =====================================================
+
+profile_runs = None
+profile_samples = None
+_profiling = threading.Lock()
+_watcher = None
+
+
+def init_profiling(runs_collection, samples_collection):
+    global profile_runs, profile_samples
+    profile_runs = runs_collection
+    profile_samples = samples_collection
+    profile_runs.create_index("until", expireAfterSeconds=3600)
+    profile_samples.create_index("run_id")
+    profile_samples.create_index("created_at", expireAfterSeconds=3600)
+
+
+def _join_run(run):
+    """Profiles this worker for a run once; safe to call from any worker."""
+    try:
+        profile_samples.insert_one({
+            "_id": f"{run['_id']}:{WORKER_ID}",
+            "run_id": run["_id"],
+            "worker": WORKER_ID,
+            "status": "running",
+            "created_at": datetime.utcnow(),
+        })
+    except DuplicateKeyError:
+        return
+
+    if not _profiling.acquire(blocking=False):
+        profile_samples.update_one({"_id": f"{run['_id']}:{WORKER_ID}"}, {"$set": {"status": "busy"}})
+        return
+
+    try:
+        seconds = (run["until"] - datetime.utcnow()).total_seconds()
+        stacks = sample_stacks(max(seconds, 0), run.get("interval_ms"))
+        profile_samples.update_one(
+            {"_id": f"{run['_id']}:{WORKER_ID}"},
+            {"$set": {"status": "done", "stacks": [[s, c] for s, c in stacks.items()]}}
+        )
+    finally:
+        _profiling.release()
+
+
+def _watch():
+    while True:
+        time.sleep(PROFILE_POLL_SECONDS)
+        try:
+            run = profile_runs.find_one({"until": {"$gt": datetime.utcnow()}})
+            if run:
+                _join_run(run)
+        except Exception:
+            logger.exception("Profile watcher error")
+
+
+def start_profile_watcher():
+    """Lets this worker join runs started on other workers (multi mode)."""
+    global _watcher
+    if profile_runs is None or (_watcher and _watcher.is_alive()):
+        return
+    _watcher = threading.Thread(target=_watch, name="profile-watcher", daemon=True)
+    _watcher.start()
+
+
+async def run_profile(seconds: float, interval_ms: float = None, all_workers: bool = False):
+    """
+    Profiles for `seconds` and returns (collapsed stacks, workers sampled).
+    With `all_workers`, other workers pick the run up from MongoDB within
+    PROFILE_POLL_SECONDS and their samples are merged in.
+    """
+    seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+
+    if not all_workers or profile_runs is None:
+        if not _profiling.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            stacks = await asyncio.to_thread(sample_stacks, seconds, interval_ms)
+        finally:
+            _profiling.release()
+        return collapsed(stacks), 1
+
+    run = {
+        "_id": uuid.uuid4().hex,
+        "started_by": WORKER_ID,
+        "interval_ms": interval_ms or PROFILE_INTERVAL_MS,
+        "until": datetime.utcnow() + timedelta(seconds=seconds),
+    }
+    # Late joiners finish up to one poll interval after the run ends.
+    deadline = time.monotonic() + seconds + PROFILE_POLL_SECONDS + 2
+    profile_runs.insert_one(run)
+    await asyncio.to_thread(_join_run, run)
+
+    while time.monotonic() < deadline:
+        if not profile_samples.count_documents({"run_id": run["_id"], "status": "running"}):
+            break
+        await asyncio.sleep(0.5)
+
+    stacks = Counter()
+    workers = 0
+    for doc in profile_samples.find({"run_id": run["_id"], "status": "done"}):
+        workers += 1
+        for stack, count in doc.get("stacks", []):
+            stacks[stack] += count
+
+    if not workers:
+        raise RuntimeError("A profile is already running")
+    return collapsed(stacks), workers
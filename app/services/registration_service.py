@@ -1,10 +1,41 @@
 from datetime import datetime
 from app.services.whatsapp_service import send_text
+from app.services.devotee import search_fields
+from app.services.coordination import SessionStore
+from app.services.analytics_service import record_event
 import logging
 
 logger = logging.getLogger("TempleBot")
 
-registration_sessions = {}
+# In-memory by default; main.py points it at MongoDB in multi-worker mode.
+registration_sessions = SessionStore()
+
+
+def optional_field(text):
+    text = (text or "").strip()
+    if not text or text.lower() == "no":
+        return "Not Provided"
+    return text
+
+
+def clean_registration(name, gotram, address, mobile, email) -> dict:
+    """
+    Normalizes devotee fields exactly as the WhatsApp flow stores them.
+    Raises ValueError if a required field is missing.
+    """
+    data = {
+        "full_name": (name or "").strip(),
+        "gotram": optional_field(gotram),
+        "address": (address or "").strip(),
+        "mobile": (mobile or "").strip(),
+        "email": optional_field(email),
+    }
+
+    for field in ("full_name", "address", "mobile"):
+        if not data[field]:
+            raise ValueError(f"{field} is required")
+
+    return data
 
 
 def start_registration(phone, devotees_collection, send_main_menu):
@@ -35,41 +66,53 @@ def handle_registration(phone, text, devotees_collection, send_main_menu):
     if step == "name":
         data["name"] = text
         session["step"] = "gotram"
+        registration_sessions[phone] = session
         send_text(phone, "Enter Gotram (or type no):")
         return
 
     if step == "gotram":
-        data["gotram"] = text if text.lower() != "no" else "Not Provided"
+        data["gotram"] = optional_field(text)
         session["step"] = "address"
+        registration_sessions[phone] = session
         send_text(phone, "Enter Address:")
         return
 
     if step == "address":
         data["address"] = text
         session["step"] = "mobile"
+        registration_sessions[phone] = session
         send_text(phone, "Enter Mobile:")
         return
 
     if step == "mobile":
         data["mobile"] = text
         session["step"] = "email"
+        registration_sessions[phone] = session
         send_text(phone, "Enter Email (or type no):")
         return
 
     if step == "email":
-        data["email"] = text if text.lower() != "no" else "Not Provided"
+        data["email"] = optional_field(text)
+
+        try:
+            record = clean_registration(
+                data["name"], data["gotram"], data["address"], data["mobile"], data["email"]
+            )
+        except ValueError:
+            registration_sessions.pop(phone, None)
+            send_text(phone, "Registration details incomplete. Please start again.")
+            send_main_menu(phone)
+            return {"status": "invalid"}
 
         devotees_collection.insert_one({
             "phone": phone,
-            "full_name": data["name"],
-            "gotram": data["gotram"],
-            "address": data["address"],
-            "mobile": data["mobile"],
-            "email": data["email"],
-            "registered_at": datetime.utcnow()
+            **record,
+            "registered_at": datetime.utcnow(),
+            **search_fields(record["full_name"], record["gotram"])
         })
 
         registration_sessions.pop(phone, None)
+        record_event("registration")
 
         send_text(phone, "🎉 Registration Successful!\nMay Lord Shiva bless you 🙏")
         send_main_menu(phone)
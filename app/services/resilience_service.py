@@ -0,0 +1,250 @@
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+
+import pymongo
+import requests
+from pymongo.errors import ConnectionFailure, NetworkTimeout
+
+logger = logging.getLogger("TempleBot")
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+# Meta redelivers a webhook it has not had a 2xx for, so a request should
+# finish well within that; Graph API and Razorpay calls share this budget.
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", "8"))
+
+# Upper bound for a single MongoDB operation, further capped by the
+# remaining budget inside a request (see BudgetedDatabase).
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "2000"))
+
+# Upper bounds for a single call, further capped by the remaining budget.
+GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", "3"))
+GRAPH_READ_TIMEOUT = float(os.getenv("GRAPH_READ_TIMEOUT", "5"))
+MIN_CALL_TIMEOUT = 0.5
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+
+# =====================================================
+# CIRCUIT BREAKER
+# =====================================================
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. After `failure_threshold` failures in a
+    row it opens and rejects calls for `open_seconds`, then lets a single
+    trial call through (half-open): success closes it, failure reopens.
+    Shared by request handlers and background threads, hence the lock.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, open_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.counters = {"opened": 0, "rejected": 0, "failures": 0}
+        self._trial_running = False
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.open_seconds:
+                self.state = "half_open"
+                self._trial_running = False
+
+            # A trial that never reported back must not block forever.
+            if self._trial_running and now - self._trial_started >= self.open_seconds:
+                self._trial_running = False
+
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                self._trial_started = now
+                return True
+
+            self.counters["rejected"] += 1
+            return False
+
+    def is_open(self) -> bool:
+        """Open and still cooling down; does not consume the half-open trial."""
+        return self.state == "open" and time.monotonic() - self.opened_at < self.open_seconds
+
+    def retry_in(self) -> float:
+        if self.state != "open":
+            return 0.0
+        return max(self.open_seconds - (time.monotonic() - self.opened_at), 0.0)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.warning(f"Circuit breaker {self.name} closed")
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def release(self):
+        """Ends a call that gave no verdict, e.g. one that was cancelled."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.counters["failures"] += 1
+            self._trial_running = False
+
+            if self.state == "half_open" or (
+                self.state == "closed" and self.failures >= self.failure_threshold
+            ):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.counters["opened"] += 1
+                logger.error(f"Circuit breaker {self.name} opened after {self.failures} failures")
+
+    def snapshot(self) -> dict:
+        return {
+            "state": "open" if self.is_open() else ("half_open" if self.state != "closed" else "closed"),
+            "consecutive_failures": self.failures,
+            "retry_in_seconds": round(self.retry_in(), 1),
+            **self.counters,
+        }
+
+
+graph_breaker = CircuitBreaker("graph_api", BREAKER_FAILURE_THRESHOLD, BREAKER_OPEN_SECONDS)
+mongo_breaker = CircuitBreaker("mongodb", BREAKER_FAILURE_THRESHOLD, BREAKER_OPEN_SECONDS)
+
+
+def is_mongo_outage(error: Exception) -> bool:
+    """
+    Connection and server-selection errors, as opposed to errors in the
+    request itself (duplicate keys, bad queries) or one slow operation
+    hitting its timeout. Only counted while the request still has budget,
+    so a request that is already out of time cannot open the breaker.
+    """
+    if not isinstance(error, ConnectionFailure) or isinstance(error, NetworkTimeout):
+        return False
+    left = remaining()
+    return left is None or left > 0
+
+
+def is_graph_outage(error: Exception, timeout) -> bool:
+    """
+    Connection errors, and timeouts at the full per-call limits. A timeout
+    the request budget cut short says the request ran late, not that Meta
+    is down, so it must not open the breaker.
+    """
+    if not isinstance(error, requests.Timeout):
+        return True
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    return connect >= GRAPH_CONNECT_TIMEOUT and read >= GRAPH_READ_TIMEOUT
+
+
+def is_graph_failure(status_code) -> bool:
+    """Throttling and server errors count against Meta; other 4xx are our fault."""
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+# =====================================================
+# REQUEST BUDGET
+# =====================================================
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+def begin_budget(seconds: float = None) -> float:
+    seconds = REQUEST_BUDGET_SECONDS if seconds is None else seconds
+    _deadline.set(time.monotonic() + seconds)
+    return seconds
+
+
+def end_budget():
+    _deadline.set(None)
+
+
+def remaining(default: float = None):
+    """Seconds left in the current request's budget, or `default` outside one."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def graph_timeout():
+    """(connect, read) timeout for one Graph API call within the budget."""
+    left = remaining()
+    if left is None:
+        return (GRAPH_CONNECT_TIMEOUT, GRAPH_READ_TIMEOUT)
+    left = max(left, MIN_CALL_TIMEOUT)
+    return (min(GRAPH_CONNECT_TIMEOUT, left), min(GRAPH_READ_TIMEOUT, left))
+
+
+def mongo_timeout() -> float:
+    """Seconds one MongoDB operation may take, within the request budget."""
+    cap = MONGO_TIMEOUT_MS / 1000
+    left = remaining()
+    if left is None:
+        return cap
+    # Never 0: pymongo.timeout(0) means no timeout at all.
+    return min(cap, max(left, MIN_CALL_TIMEOUT))
+
+
+class BudgetedCollection:
+    """
+    A Collection whose calls each run under pymongo.timeout(mongo_timeout()).
+    Iterating a cursor returned by find() keeps the client's own timeoutMS.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            with pymongo.timeout(mongo_timeout()):
+                return attr(*args, **kwargs)
+
+        return call
+
+
+class BudgetedDatabase:
+    """A Database whose collections are BudgetedCollections."""
+
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return BudgetedCollection(self._database[name])
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+
+def metrics() -> dict:
+    return {
+        "graph_api": graph_breaker.snapshot(),
+        "mongodb": mongo_breaker.snapshot(),
+        "request_budget_seconds": REQUEST_BUDGET_SECONDS,
+        "mongo_timeout_ms": MONGO_TIMEOUT_MS,
+    }
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger("TempleBot")
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+# Messages one sender may send per window; 0 disables rate limiting.
+RATE_LIMIT_MESSAGES = int(os.getenv("RATE_LIMIT_MESSAGES", "20"))
+RATE_LIMIT_WINDOW_SECONDS = float(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+
+# Event-loop lag (smoothed) above which only cheap replies are served;
+# shedding stops once it falls below half of this. 0 disables shedding.
+SHED_LAG_MS = float(os.getenv("SHED_LAG_MS", "500"))
+LAG_PROBE_SECONDS = 0.1
+LAG_SMOOTHING = 0.2
+
+# Bounds memory if many one-off senders write in.
+SWEEP_EVERY = 1000
+
+# Options (list replies, or free text routed to them) still served while
+# shedding. Next tithi comes from the in-memory calendar; the menu after
+# it costs one indexed session read. Language options are left out:
+# lang_* writes the session, and offering change_lang would only lead to
+# a choice that is itself shed.
+CHEAP_OPTIONS = {"next_tithi"}
+
+# Intents answered with the static main menu while shedding: no session
+# read, so the menu is in the default language.
+SHED_MENU_INTENTS = {"greeting", "menu"}
+
+SLOW_DOWN_TEXT = (
+    "⏳ You are sending messages too quickly. Please wait a minute and try again.\n"
+    "⏳ మీరు చాలా వేగంగా సందేశాలు పంపుతున్నారు. దయచేసి ఒక నిమిషం తర్వాత ప్రయత్నించండి."
+)
+
+BUSY_TEXT = (
+    "🙏 We are handling many requests right now. We will reply to your message shortly.\n"
+    "🙏 ప్రస్తుతం చాలా అభ్యర్థనలు ఉన్నాయి. మీ సందేశానికి త్వరలో సమాధానం ఇస్తాము."
+)
+
+counters = {
+    "throttled": 0,
+    "slow_down_sent": 0,
+    "shed": 0,
+    "busy_sent": 0,
+    "shed_menu_sent": 0,
+    "shedding_episodes": 0,
+}
+
+
+# =====================================================
+# PER-SENDER RATE LIMIT
+# =====================================================
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window log per sender, kept in process memory so a flood is
+    rejected before any database access. Only the event loop calls it,
+    so no locking is needed.
+
+    The log is per process, not shared: with N workers a sender can get
+    up to N * limit messages through per window. That still bounds a
+    flood, and sharing it would cost a database write per message.
+    """
+
+    def __init__(self, limit: int, window_seconds: float):
+        self.limit = limit
+        self.window = window_seconds
+        self._hits = {}
+        self._notified_at = {}
+        self._checks = 0
+
+    def check(self, sender: str, now: float = None):
+        """
+        Records a message and returns (allowed, notify). `notify` is True
+        for the first rejected message in a window, so the sender is told
+        to slow down once rather than on every message.
+        """
+        if self.limit <= 0:
+            return True, False
+
+        now = time.monotonic() if now is None else now
+
+        self._checks += 1
+        if self._checks % SWEEP_EVERY == 0:
+            self._sweep(now)
+
+        hits = self._hits.get(sender)
+        if hits is None:
+            hits = self._hits[sender] = deque(maxlen=self.limit)
+
+        if len(hits) == self.limit and now - hits[0] < self.window:
+            last = self._notified_at.get(sender)
+            notify = last is None or now - last >= self.window
+            if notify:
+                self._notified_at[sender] = now
+            return False, notify
+
+        hits.append(now)
+        return True, False
+
+    def _sweep(self, now: float):
+        idle = [s for s, hits in self._hits.items() if not hits or now - hits[-1] >= self.window]
+        for sender in idle:
+            del self._hits[sender]
+        for sender, at in list(self._notified_at.items()):
+            if now - at >= self.window:
+                del self._notified_at[sender]
+
+    def __len__(self):
+        return len(self._hits)
+
+
+# =====================================================
+# LOAD SHEDDING
+# =====================================================
+
+class LoadMonitor:
+    """
+    Measures how long ready work waits for the event loop. Webhook
+    handlers do synchronous Mongo and Graph calls on the loop, so this lag
+    is the queueing delay every new request sees.
+
+    Lag and `_told` are per process, which is intended: each worker sheds
+    on its own loop's lag. A sender shed by several workers may get one
+    busy note from each.
+    """
+
+    def __init__(self, threshold_ms: float):
+        self.threshold_ms = threshold_ms
+        self.lag_ms = 0.0
+        self.shedding = False
+        self._task = None
+        # Senders told we are busy during the current episode.
+        self._told = set()
+
+    def observe(self, lag_ms: float):
+        self.lag_ms += LAG_SMOOTHING * (lag_ms - self.lag_ms)
+
+        if not self.threshold_ms:
+            return
+
+        if not self.shedding and self.lag_ms > self.threshold_ms:
+            self.shedding = True
+            self._told.clear()
+            counters["shedding_episodes"] += 1
+            logger.warning(f"Load shedding on: event loop lag {self.lag_ms:.0f} ms")
+        elif self.shedding and self.lag_ms < self.threshold_ms / 2:
+            self.shedding = False
+            self._told.clear()
+            logger.warning(f"Load shedding off: event loop lag {self.lag_ms:.0f} ms")
+
+    def should_tell(self, sender: str) -> bool:
+        """True the first time a sender is shed in this episode."""
+        if sender in self._told:
+            return False
+        self._told.add(sender)
+        return True
+
+    async def _probe(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_SECONDS)
+            self.observe((time.perf_counter() - start - LAG_PROBE_SECONDS) * 1000)
+
+    def start(self):
+        if self._task is None and self.threshold_ms:
+            self._task = asyncio.get_running_loop().create_task(self._probe())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+limiter = SlidingWindowLimiter(RATE_LIMIT_MESSAGES, RATE_LIMIT_WINDOW_SECONDS)
+load_monitor = LoadMonitor(SHED_LAG_MS)
+
+
+def metrics() -> dict:
+    return {
+        **counters,
+        "shedding": load_monitor.shedding,
+        "loop_lag_ms": round(load_monitor.lag_ms, 1),
+        "tracked_senders": len(limiter),
+    }
@@ -1,13 +1,27 @@
 import requests
 import logging
 import os
+import time
+
+from app.services.coordination import is_multi_worker
+from app.services.profiling_service import stage
+from app.services.resilience_service import (
+    CircuitOpenError,
+    graph_breaker,
+    graph_timeout,
+    is_graph_failure,
+    is_graph_outage
+)
 
 logger = logging.getLogger("TempleBot")
 
 WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
 PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 
-GRAPH_URL = f"https://graph.facebook.com/v18.0/{PHONE_NUMBER_ID}/messages"
+# Overridable so load tests can point at a local stub Graph server.
+GRAPH_API_BASE = os.getenv("GRAPH_API_BASE", "https://graph.facebook.com/v18.0")
+GRAPH_URL = f"{GRAPH_API_BASE}/{PHONE_NUMBER_ID}/messages"
+MEDIA_URL = f"{GRAPH_API_BASE}/{PHONE_NUMBER_ID}/media"
 
 
 def normalize_phone(phone: str) -> str:
@@ -17,13 +31,59 @@ def normalize_phone(phone: str) -> str:
     return phone
 
 
-def whatsapp_request(payload: dict):
+# Set by main.py. With `outbox_all` every reply goes through the outbox;
+# otherwise it only holds replies deferred while the Graph API is failing.
+outbox = None
+outbox_all = True
+
+# Set by the media service; called with a media id that Meta rejected.
+media_failure_handler = None
+
+# Once a recipient has deferred replies, later ones queue behind them for
+# a while so the devotee still receives them in order. `_deferred` only
+# knows this process's deferrals; in multi mode _should_queue also asks
+# the shared outbox, so another worker cannot overtake a queued reply.
+DEFER_STICKY_SECONDS = 600
+_deferred = {}
+
+
+def use_outbox(outbox_instance, all_messages: bool = True):
+    global outbox, outbox_all
+    outbox = outbox_instance
+    outbox_all = all_messages
+
+
+def deliver(payload: dict, http=requests, timeout=None):
+    """
+    Sends one payload to the Graph API now. `http` may be a pooled Session.
+    Fails fast with CircuitOpenError while the Graph API breaker is open;
+    without an explicit timeout, the request's remaining budget applies.
+    """
+    if not graph_breaker.allow():
+        raise CircuitOpenError("Graph API circuit breaker is open")
+
     headers = {
         "Authorization": f"Bearer {WHATSAPP_TOKEN}",
         "Content-Type": "application/json"
     }
 
-    response = requests.post(GRAPH_URL, headers=headers, json=payload)
+    timeout = timeout or graph_timeout()
+    try:
+        response = http.post(GRAPH_URL, headers=headers, json=payload, timeout=timeout)
+    except requests.RequestException as e:
+        if is_graph_outage(e, timeout):
+            graph_breaker.record_failure()
+        else:
+            graph_breaker.release()
+        raise
+    except BaseException:
+        graph_breaker.release()
+        raise
+
+    if is_graph_failure(response.status_code):
+        graph_breaker.record_failure()
+    else:
+        graph_breaker.record_success()
 
     logger.info(f"WhatsApp Status: {response.status_code}")
     logger.info(f"WhatsApp Response: {response.text}")
@@ -31,6 +91,59 @@ def whatsapp_request(payload: dict):
     return response
 
 
+def _should_queue(phone) -> bool:
+    if outbox is None:
+        return False
+    if outbox_all or graph_breaker.is_open():
+        return True
+    until = _deferred.get(phone)
+    if until is not None and until > time.monotonic():
+        return True
+    return is_multi_worker() and outbox.has_unfinished(phone)
+
+
+def _defer(payload: dict, fallback: dict = None, reason=None):
+    """Queues a reply the Graph API could not take now."""
+    now = time.monotonic()
+    if len(_deferred) > 10000:
+        for phone in [p for p, until in _deferred.items() if until <= now]:
+            _deferred.pop(phone, None)
+    _deferred[payload.get("to")] = now + DEFER_STICKY_SECONDS
+
+    logger.warning(f"Deferring reply to {payload.get('to')} via outbox: {reason}")
+    with stage(f"defer:{payload.get('type')}"):
+        return outbox.enqueue(payload, fallback=fallback)
+
+
+def _deliver_or_defer(payload: dict, fallback: dict = None):
+    """
+    Re-queues only what Meta certainly did not take: connection errors and
+    5xx/429. After a read timeout the message may already be delivered, so
+    it is not sent again.
+    """
+    try:
+        response = deliver(payload)
+    except requests.ReadTimeout:
+        logger.warning(f"Reply to {payload.get('to')} timed out awaiting Meta; not re-sent")
+        raise
+    except requests.RequestException as e:
+        if outbox is None:
+            raise
+        return _defer(payload, fallback, e)
+
+    if outbox is not None and is_graph_failure(response.status_code):
+        return _defer(payload, fallback, f"status {response.status_code}")
+    return response
+
+
+def whatsapp_request(payload: dict):
+    if _should_queue(payload.get("to")):
+        with stage(f"enqueue:{payload.get('type')}"):
+            return outbox.enqueue(payload)
+    with stage(f"send:{payload.get('type')}"):
+        return _deliver_or_defer(payload)
+
+
 def send_text(phone: str, message: str):
     payload = {
         "messaging_product": "whatsapp",
@@ -72,3 +185,81 @@ def send_image(phone: str, image_url: str, caption: str):
         }
     }
     return whatsapp_request(payload)
+
+
+# Meta's errors for a media id it cannot use (unknown, expired or failed).
+# Anything else, such as auth errors or 131047/131026 for one recipient,
+# says nothing about the cached id.
+MEDIA_ERROR_CODES = {131052, 131053}
+MEDIA_ERROR_SUBCODES = {2494102}
+
+
+def is_media_error(response) -> bool:
+    try:
+        error = response.json().get("error") or {}
+    except ValueError:
+        return False
+    return error.get("code") in MEDIA_ERROR_CODES or error.get("error_subcode") in MEDIA_ERROR_SUBCODES
+
+
+def report_media_failure(media_id: str):
+    if media_failure_handler and media_id:
+        media_failure_handler(media_id)
+
+
+def send_image_by_id(phone: str, media_id: str, caption: str, fallback_link: str):
+    """
+    Sends a previously uploaded image. If Meta rejects the request, the
+    image is sent again by link so the devotee still receives it; the
+    cached id is only dropped when the error is about the media itself.
+    """
+    payload = {
+        "messaging_product": "whatsapp",
+        "to": phone,
+        "type": "image",
+        "image": {
+            "id": media_id,
+            "caption": caption
+        }
+    }
+    fallback = {
+        "messaging_product": "whatsapp",
+        "to": phone,
+        "type": "image",
+        "image": {
+            "link": fallback_link,
+            "caption": caption
+        }
+    }
+
+    if _should_queue(phone):
+        with stage("enqueue:image"):
+            return outbox.enqueue(payload, fallback=fallback)
+
+    with stage("send:image"):
+        response = _deliver_or_defer(payload, fallback)
+    # No status code when the reply was deferred to the outbox.
+    status_code = getattr(response, "status_code", None)
+    if status_code and 400 <= status_code < 500 and status_code != 429:
+        logger.warning(f"Media id {media_id} send rejected ({status_code}); falling back to link")
+        if is_media_error(response):
+            report_media_failure(media_id)
+        with stage("send:image"):
+            return _deliver_or_defer(fallback)
+    return response
+
+
+def upload_media(content: bytes, filename: str, mime_type: str, http=requests, timeout=60) -> str:
+    """Uploads a file to the WhatsApp media endpoint and returns its media id."""
+    response = http.post(
+        MEDIA_URL,
+        headers={"Authorization": f"Bearer {WHATSAPP_TOKEN}"},
+        data={"messaging_product": "whatsapp", "type": mime_type},
+        files={"file": (filename, content, mime_type)},
+        timeout=timeout,
+    )
+
+    if response.status_code >= 300:
+        raise RuntimeError(f"Media upload failed: {response.status_code} {response.text[:200]}")
+
+    return response.json()["id"]
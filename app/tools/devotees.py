@@ -0,0 +1,237 @@
+"""
+Devotee directory CLI for temple staff.
+
+    python -m app.tools.devotees search --name rav --gotram kashyapa
+    python -m app.tools.devotees export --format csv > devotees.csv
+    python -m app.tools.devotees backfill
+    python -m app.tools.devotees import register.csv --errors errors.jsonl [--resume]
+    python -m app.tools.devotees bench --count 100000 --uri mongodb://localhost:27017
+
+Connects to MONGODB_URI (or --uri). `bench` seeds synthetic devotees into a
+separate `sohum_bench` database, which it drops first and leaves in place.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+from app.services.devotee import (
+    backfill_search_fields,
+    ensure_devotee_indexes,
+    search_devotees,
+    search_fields,
+    stream_export,
+)
+from app.services.import_service import import_devotees
+
+DB_NAME = os.getenv("MONGODB_DB", "sohum_db")
+BENCH_DB_NAME = "sohum_bench"
+
+
+def connect(args, db_name):
+    if args.offline:
+        from app.tools.fakes import FakeMongoClient
+        client = FakeMongoClient()
+    else:
+        uri = args.uri or os.getenv("MONGODB_URI")
+        if not uri:
+            sys.exit("Set MONGODB_URI or pass --uri")
+        client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    return client, client[db_name]["devotees"]
+
+
+# =====================================================
+# COMMANDS
+# =====================================================
+
+def cmd_search(args):
+    _, devotees = connect(args, DB_NAME)
+    page = search_devotees(
+        devotees, args.name, args.gotram, args.mobile, args.q, args.cursor, args.limit
+    )
+    for item in page["items"]:
+        print(json.dumps(item, ensure_ascii=False))
+    if page["next_cursor"]:
+        print(f"# next: --cursor {page['next_cursor']}", file=sys.stderr)
+
+
+def cmd_export(args):
+    _, devotees = connect(args, DB_NAME)
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        for chunk in stream_export(
+            devotees, args.format,
+            name=args.name, gotram=args.gotram, mobile=args.mobile, text=args.q,
+        ):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def cmd_backfill(args):
+    _, devotees = connect(args, DB_NAME)
+    ensure_devotee_indexes(devotees)
+    print(f"Backfilled search fields on {backfill_search_fields(devotees)} devotees")
+
+
+def cmd_import(args):
+    _, devotees = connect(args, DB_NAME)
+    errors_out = open(args.errors, "a", encoding="utf-8") if args.errors else None
+    try:
+        stats = import_devotees(
+            devotees, args.file, resume=args.resume,
+            batch_size=args.batch_size, errors_out=errors_out,
+        )
+    finally:
+        if errors_out:
+            errors_out.close()
+
+    print(json.dumps(stats))
+    return 1 if stats["invalid"] or stats["failed"] else 0
+
+
+# =====================================================
+# BENCHMARK
+# =====================================================
+
+FIRST_NAMES = ["Ravi", "Lakshmi", "Srinivas", "Padma", "Venkata", "Sita", "Rama", "Anjali",
+               "Suresh", "Kavitha", "Mahesh", "Swathi", "Naresh", "Bhavani", "Gopal", "Uma"]
+LAST_NAMES = ["Reddy", "Rao", "Sharma", "Goud", "Naidu", "Chary", "Varma", "Shastry"]
+GOTRAMS = ["Kashyapa", "Bharadwaja", "Vasishta", "Atreya", "Kaundinya", "Gautama",
+           "Harita", "Srivatsa", "Not Provided"]
+
+
+def synthetic_devotee(i, rng, base_time):
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+    gotram = rng.choice(GOTRAMS)
+    return {
+        "phone": f"91{7000000000 + i}",
+        "full_name": name,
+        "gotram": gotram,
+        "address": f"{rng.randint(1, 999)}, Nalgonda",
+        "mobile": str(7000000000 + i),
+        "email": "Not Provided",
+        "registered_at": base_time + timedelta(seconds=i),
+        **search_fields(name, gotram),
+    }
+
+
+def timed(label, fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) * 1000 / repeat
+    print(f"{label:<38} {elapsed:9.2f} ms")
+    return result
+
+
+def cmd_bench(args):
+    client, devotees = connect(args, BENCH_DB_NAME)
+    if not args.offline:
+        client.drop_database(BENCH_DB_NAME)
+        devotees = client[BENCH_DB_NAME]["devotees"]
+
+    devotees.create_index("phone", unique=True)
+    ensure_devotee_indexes(devotees)
+
+    rng = random.Random(42)
+    base_time = datetime(2026, 1, 1)
+
+    start = time.perf_counter()
+    batch = []
+    for i in range(args.count):
+        batch.append(synthetic_devotee(i, rng, base_time))
+        if len(batch) == 5000:
+            devotees.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        devotees.insert_many(batch, ordered=False)
+    seed_s = time.perf_counter() - start
+    print(f"Seeded {args.count} devotees in {seed_s:.1f}s ({args.count / seed_s:.0f}/s)\n")
+
+    timed("name prefix 'rav', first page", lambda: search_devotees(devotees, name="rav"), 20)
+    timed("gotram 'atreya', first page", lambda: search_devotees(devotees, gotram="atreya"), 20)
+    timed("mobile exact lookup", lambda: search_devotees(devotees, mobile=str(7000000000 + args.count // 2)), 20)
+
+    def walk_pages(pages=20):
+        cursor = None
+        for _ in range(pages):
+            page = search_devotees(devotees, name="s", cursor=cursor, limit=100)
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+
+    timed("20 pages x 100 by name prefix 's'", walk_pages)
+
+    for fmt in ("csv", "jsonl"):
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        size = 0
+        for chunk in stream_export(devotees, fmt):
+            size += len(chunk)
+        elapsed = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(
+            f"export {fmt:<5} {args.count} rows{'':<13} {elapsed * 1000:9.2f} ms "
+            f"({args.count / elapsed:.0f} rows/s, {size / 1e6:.1f} MB, "
+            f"peak RSS +{(rss_after - rss_before) / 1024:.1f} MB)"
+        )
+
+
+# =====================================================
+# CLI
+# =====================================================
+
+def add_filters(parser):
+    parser.add_argument("--name", help="full name prefix (case-insensitive)")
+    parser.add_argument("--gotram")
+    parser.add_argument("--mobile")
+    parser.add_argument("--q", help="free-text search over name, gotram and address")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Devotee directory search and export")
+    parser.add_argument("--uri", help="MongoDB URI (defaults to MONGODB_URI)")
+    parser.add_argument("--offline", action="store_true", help="use the in-memory stand-in")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    search = sub.add_parser("search")
+    add_filters(search)
+    search.add_argument("--cursor")
+    search.add_argument("--limit", type=int, default=50)
+    search.set_defaults(func=cmd_search)
+
+    export = sub.add_parser("export")
+    add_filters(export)
+    export.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    export.add_argument("--output", "-o")
+    export.set_defaults(func=cmd_export)
+
+    backfill = sub.add_parser("backfill")
+    backfill.set_defaults(func=cmd_backfill)
+
+    importer = sub.add_parser("import", help="bulk upsert devotees from CSV or JSONL")
+    importer.add_argument("file")
+    importer.add_argument("--errors", help="append per-row errors to this JSONL file")
+    importer.add_argument("--resume", action="store_true", help="continue after the last checkpoint")
+    importer.add_argument("--batch-size", type=int, default=1000)
+    importer.set_defaults(func=cmd_import)
+
+    bench = sub.add_parser("bench")
+    bench.add_argument("--count", type=int, default=100000)
+    bench.set_defaults(func=cmd_bench)
+
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,672 @@
+"""
+In-memory stand-ins for MongoDB, the WhatsApp Graph API and Razorpay.
+
+Used by the offline tools (replay, benchmarks) so the real app can be
+exercised on a laptop without a database or Meta credentials. Only the
+subset of the pymongo API that this codebase actually uses is covered.
+"""
+
+import copy
+import hashlib
+import hmac
+import itertools
+import json
+import re
+import threading
+import time
+
+from bson import ObjectId
+from pymongo import DeleteOne, InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import BulkWriteResult
+
+
+# =====================================================
+# QUERY MATCHING
+# =====================================================
+
+def _get(doc, path):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None, False
+        value = value[part]
+    return value, True
+
+
+def _match_value(value, exists, cond):
+    if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+        for op, arg in cond.items():
+            if op == "$exists":
+                if bool(arg) != exists:
+                    return False
+            elif op == "$ne":
+                if value == arg or (isinstance(value, list) and arg in value):
+                    return False
+            elif op == "$in":
+                if value not in arg:
+                    return False
+            elif op == "$nin":
+                if value in arg:
+                    return False
+            elif not exists or value is None:
+                return False
+            elif op == "$gt" and not value > arg:
+                return False
+            elif op == "$gte" and not value >= arg:
+                return False
+            elif op == "$lt" and not value < arg:
+                return False
+            elif op == "$lte" and not value <= arg:
+                return False
+            elif op == "$regex":
+                if not isinstance(value, str) or not re.search(arg, value, re.I if "i" in cond.get("$options", "") else 0):
+                    return False
+        return True
+    # Like MongoDB, a scalar matches an array field that contains it.
+    if isinstance(value, list) and not isinstance(cond, list):
+        return cond in value
+    return value == cond
+
+
+def matches(doc, query):
+    for key, cond in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in cond):
+                return False
+            continue
+        if key == "$and":
+            if not all(matches(doc, q) for q in cond):
+                return False
+            continue
+        value, exists = _get(doc, key)
+        if not _match_value(value, exists, cond):
+            return False
+    return True
+
+
+def _parent(doc, path, create=True):
+    """Container and final key for a dotted path like "options.register"."""
+    *parents, last = path.split(".")
+    for part in parents:
+        if part not in doc:
+            if not create:
+                return None, last
+            doc[part] = {}
+        doc = doc[part]
+    return doc, last
+
+
+def _apply_update(doc, update, inserting=False):
+    for key, value in update.get("$set", {}).items():
+        parent, last = _parent(doc, key)
+        parent[last] = copy.deepcopy(value)
+    if inserting:
+        for key, value in update.get("$setOnInsert", {}).items():
+            parent, last = _parent(doc, key)
+            parent[last] = copy.deepcopy(value)
+    for key in update.get("$unset", {}):
+        parent, last = _parent(doc, key, create=False)
+        if parent is not None:
+            parent.pop(last, None)
+    for key, value in update.get("$inc", {}).items():
+        parent, last = _parent(doc, key)
+        parent[last] = parent.get(last, 0) + value
+    for key, value in update.get("$max", {}).items():
+        parent, last = _parent(doc, key)
+        if last not in parent or parent[last] < value:
+            parent[last] = value
+    for key, value in update.get("$push", {}).items():
+        parent, last = _parent(doc, key)
+        items = parent.setdefault(last, [])
+        if isinstance(value, dict) and "$each" in value:
+            items.extend(copy.deepcopy(value["$each"]))
+            if "$slice" in value:
+                parent[last] = items[value["$slice"]:] if value["$slice"] < 0 else items[:value["$slice"]]
+        else:
+            items.append(copy.deepcopy(value))
+    for key, value in update.get("$min", {}).items():
+        parent, last = _parent(doc, key)
+        if last not in parent or parent[last] > value:
+            parent[last] = value
+
+
+# =====================================================
+# RESULTS & CURSOR
+# =====================================================
+
+class _Result:
+    def __init__(self, **kwargs):
+        self.acknowledged = True
+        self.inserted_id = None
+        self.matched_count = 0
+        self.modified_count = 0
+        self.upserted_id = None
+        self.deleted_count = 0
+        self.__dict__.update(kwargs)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+        self._iter = None
+
+    def sort(self, key_or_list, direction=1):
+        keys = key_or_list if isinstance(key_or_list, list) else [(key_or_list, direction)]
+        for key, d in reversed(keys):
+            self._docs.sort(key=lambda doc: (_get(doc, key)[0] is None, _get(doc, key)[0]), reverse=d < 0)
+        return self
+
+    def skip(self, n):
+        self._docs = self._docs[n:]
+        return self
+
+    def limit(self, n):
+        if n:
+            self._docs = self._docs[:n]
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+    def __next__(self):
+        if self._iter is None:
+            self._iter = iter(self._docs)
+        return next(self._iter)
+
+
+# =====================================================
+# COLLECTION / DATABASE / CLIENT
+# =====================================================
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self._docs = {}
+        # unique index fields -> {key tuple: _id}
+        self._unique = {}
+        # Sparse unique indexes skip documents missing the fields.
+        self._sparse = set()
+        self._lock = threading.RLock()
+
+    # -- indexes --------------------------------------
+
+    def create_index(self, keys, unique=False, **kwargs):
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        fields = tuple(k for k, _ in keys)
+        if unique and fields not in self._unique:
+            if kwargs.get("sparse"):
+                self._sparse.add(fields)
+            index = {}
+            for doc in self._docs.values():
+                key = self._index_key(doc, fields)
+                if key is not None:
+                    index[key] = doc["_id"]
+            self._unique[fields] = index
+        return kwargs.get("name") or "_".join(f"{k}_{d}" for k, d in keys)
+
+    @staticmethod
+    def _key(doc, fields):
+        return tuple(_get(doc, f)[0] for f in fields)
+
+    def _index_key(self, doc, fields):
+        if fields in self._sparse and not any(_get(doc, f)[1] for f in fields):
+            return None
+        return self._key(doc, fields)
+
+    def _check_unique(self, doc):
+        for fields, index in self._unique.items():
+            key = self._index_key(doc, fields)
+            owner = index.get(key) if key is not None else None
+            if owner is not None and owner != doc["_id"]:
+                raise DuplicateKeyError(f"E11000 duplicate key {self.name} {fields}={key}")
+
+    def _index_add(self, doc):
+        for fields, index in self._unique.items():
+            key = self._index_key(doc, fields)
+            if key is not None:
+                index[key] = doc["_id"]
+
+    def _index_remove(self, doc):
+        for fields, index in self._unique.items():
+            key = self._index_key(doc, fields)
+            if key is not None and index.get(key) == doc["_id"]:
+                del index[key]
+
+    def _candidates(self, query):
+        """Narrows the scan using _id or a single-field unique index."""
+        query = query or {}
+        if "_id" in query and not isinstance(query["_id"], dict):
+            doc = self._docs.get(query["_id"])
+            return [doc] if doc else []
+        for (field,), index in ((f, i) for f, i in self._unique.items() if len(f) == 1):
+            value = query.get(field)
+            if field in query and not isinstance(value, dict):
+                _id = index.get((value,))
+                return [self._docs[_id]] if _id is not None else []
+        return list(self._docs.values())
+
+    def _matching(self, query):
+        return [d for d in self._candidates(query) if matches(d, query)]
+
+    # -- reads ----------------------------------------
+
+    def find_one(self, query=None, projection=None, sort=None):
+        with self._lock:
+            docs = self._matching(query)
+            if sort:
+                docs = list(FakeCursor(docs).sort(sort))
+            return copy.deepcopy(docs[0]) if docs else None
+
+    def find(self, query=None, projection=None, **kwargs):
+        with self._lock:
+            docs = [copy.deepcopy(d) for d in self._matching(query)]
+        cursor = FakeCursor(docs)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    def count_documents(self, query=None, **kwargs):
+        with self._lock:
+            return len(self._matching(query))
+
+    # -- writes ---------------------------------------
+
+    def insert_one(self, doc):
+        with self._lock:
+            doc.setdefault("_id", ObjectId())
+            if doc["_id"] in self._docs:
+                raise DuplicateKeyError(f"E11000 duplicate key {self.name} _id={doc['_id']}")
+            stored = copy.deepcopy(doc)
+            self._check_unique(stored)
+            self._docs[stored["_id"]] = stored
+            self._index_add(stored)
+        return _Result(inserted_id=doc["_id"])
+
+    def insert_many(self, docs, ordered=True):
+        ids = []
+        for doc in docs:
+            ids.append(self.insert_one(doc).inserted_id)
+        return _Result(inserted_ids=ids)
+
+    def _update(self, query, update, upsert, many):
+        with self._lock:
+            targets = self._matching(query)
+            if not many:
+                targets = targets[:1]
+
+            for doc in targets:
+                candidate = copy.deepcopy(doc)
+                _apply_update(candidate, update)
+                self._check_unique(candidate)
+                self._index_remove(doc)
+                doc.clear()
+                doc.update(candidate)
+                self._index_add(doc)
+
+            if targets or not upsert:
+                return _Result(matched_count=len(targets), modified_count=len(targets))
+
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            doc.setdefault("_id", ObjectId())
+            if doc["_id"] in self._docs:
+                raise DuplicateKeyError(f"E11000 duplicate key {self.name} _id={doc['_id']}")
+            _apply_update(doc, update, inserting=True)
+            self._check_unique(doc)
+            self._docs[doc["_id"]] = doc
+            self._index_add(doc)
+            return _Result(upserted_id=doc["_id"])
+
+    def update_one(self, query, update, upsert=False):
+        return self._update(query, update, upsert, many=False)
+
+    def update_many(self, query, update, upsert=False):
+        return self._update(query, update, upsert, many=True)
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=False, sort=None, **kwargs):
+        with self._lock:
+            before = self.find_one(query, sort=sort)
+            if before is not None:
+                self.update_one({"_id": before["_id"]}, update)
+                after_query = {"_id": before["_id"]}
+            else:
+                if not upsert:
+                    return None
+                result = self.update_one(query, update, upsert=True)
+                after_query = {"_id": result.upserted_id}
+            if return_document:
+                return self.find_one(after_query)
+            return before
+
+    def bulk_write(self, operations, ordered=True):
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0,
+                  "nRemoved": 0, "upserted": [], "writeErrors": []}
+
+        for index, op in enumerate(operations):
+            try:
+                if isinstance(op, InsertOne):
+                    self.insert_one(op._doc)
+                    result["nInserted"] += 1
+                elif isinstance(op, (UpdateOne, UpdateMany)):
+                    r = self._update(op._filter, op._doc, op._upsert, many=isinstance(op, UpdateMany))
+                    if r.upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": r.upserted_id})
+                    result["nMatched"] += r.matched_count
+                    result["nModified"] += r.modified_count
+                elif isinstance(op, DeleteOne):
+                    result["nRemoved"] += self.delete_one(op._filter).deleted_count
+                else:
+                    raise TypeError(f"Unsupported bulk operation: {op!r}")
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    def find_one_and_delete(self, query, **kwargs):
+        with self._lock:
+            doc = self.find_one(query, sort=kwargs.get("sort"))
+            if doc is not None:
+                self.delete_one({"_id": doc["_id"]})
+            return doc
+
+    def delete_one(self, query):
+        with self._lock:
+            docs = self._matching(query)[:1]
+            for doc in docs:
+                self._index_remove(doc)
+                del self._docs[doc["_id"]]
+        return _Result(deleted_count=len(docs))
+
+    def delete_many(self, query):
+        with self._lock:
+            docs = self._matching(query)
+            for doc in docs:
+                self._index_remove(doc)
+                del self._docs[doc["_id"]]
+        return _Result(deleted_count=len(docs))
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name)
+        return self._collections[name]
+
+    __getattr__ = __getitem__
+
+
+class _FakeAdmin:
+    def command(self, name, *args, **kwargs):
+        return {"ok": 1.0}
+
+
+class FakeMongoClient:
+    def __init__(self, *args, **kwargs):
+        self._databases = {}
+        self.admin = _FakeAdmin()
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = FakeDatabase()
+        return self._databases[name]
+
+    def close(self):
+        pass
+
+
+# =====================================================
+# GRAPH API
+# =====================================================
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = json.dumps(payload)
+        self.ok = status_code < 400
+
+    def json(self):
+        return self._payload
+
+
+class FakeGraphAPI:
+    """
+    Records every outbound Graph API call instead of sending it.
+
+    Install with `graph.install()`, which swaps `requests.post` for the
+    recorder and `requests.get` for a stub asset download. Media uploads
+    return fresh ids; sending an image by an unknown id fails with 400
+    like the real API. `latency_ms` simulates Meta's round-trip time.
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.sent = []
+        self.uploads = []
+        self.media_ids = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def post(self, url, headers=None, json=None, files=None, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        with self._lock:
+            if url.endswith("/media"):
+                media_id = f"media.fake.{next(self._ids)}"
+                self.media_ids.add(media_id)
+                self.uploads.append({"url": url, "id": media_id})
+                return FakeResponse(200, {"id": media_id})
+
+            image_id = ((json or {}).get("image") or {}).get("id")
+            if image_id and image_id not in self.media_ids:
+                return FakeResponse(400, {"error": {"code": 131053, "message": "Invalid media id"}})
+
+            self.sent.append({"url": url, "payload": json})
+            message_id = f"wamid.fake.{next(self._ids)}"
+        return FakeResponse(200, {"messages": [{"id": message_id}]})
+
+    def get(self, url, **kwargs):
+        response = FakeResponse(200, {})
+        response.content = b"\x89PNG fake asset " + url.encode()
+        response.raise_for_status = lambda: None
+        return response
+
+    def drain(self):
+        with self._lock:
+            sent, self.sent = self.sent, []
+        return sent
+
+    def install(self):
+        import requests
+        requests.post = self.post
+        requests.get = self.get
+        return self
+
+
+class GraphStubServer:
+    """
+    Real HTTP server that answers like the Graph messages endpoint.
+
+    Use it where the code under test must go over a socket (other
+    processes, pooled sessions). `fail_rate` returns 500s at random and
+    `latency_ms` delays each response. POSTs to .../media act as the media
+    upload endpoint; images sent by an id it never issued get a 400.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, fail_rate: float = 0.0, seed: int = 0):
+        import random
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        stub = self
+        self.sent = []
+        self.uploads = []
+        self.media_ids = set()
+        self.failed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # One write per response; avoids delayed-ACK stalls on keep-alive.
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if latency_ms:
+                    time.sleep(latency_ms / 1000)
+
+                status, reply = 200, b'{"messages":[{"id":"wamid.stub"}]}'
+
+                with stub._lock:
+                    if self.path.endswith("/media"):
+                        media_id = f"media.stub.{len(stub.uploads) + 1}"
+                        stub.media_ids.add(media_id)
+                        stub.uploads.append({"id": media_id, "bytes": len(body)})
+                        reply = json.dumps({"id": media_id}).encode()
+                    elif stub._rng.random() < fail_rate:
+                        stub.failed += 1
+                        status, reply = 500, b'{"error":{"message":"stub failure"}}'
+                    else:
+                        payload = json.loads(body)
+                        image_id = (payload.get("image") or {}).get("id")
+                        if image_id and image_id not in stub.media_ids:
+                            stub.rejected += 1
+                            status, reply = 400, b'{"error":{"code":131053,"message":"Invalid media id"}}'
+                        else:
+                            stub.sent.append(payload)
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self.base_url = f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+
+
+# =====================================================
+# RAZORPAY
+# =====================================================
+
+class _FakeRazorpayOrders:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, data):
+        client = self._client
+        if client.latency_ms:
+            time.sleep(client.latency_ms / 1000)
+        with client._lock:
+            client.calls["order.create"] += 1
+            order = {
+                "id": f"order_fake{next(client._ids)}",
+                "entity": "order",
+                "amount": data["amount"],
+                "currency": data.get("currency", "INR"),
+                "receipt": data.get("receipt"),
+                "notes": data.get("notes", {}),
+                "status": "created",
+                "created_at": int(time.time()),
+            }
+            client.orders[order["id"]] = order
+        return dict(order)
+
+    def fetch(self, order_id):
+        with self._client._lock:
+            self._client.calls["order.fetch"] += 1
+            return dict(self._client.orders[order_id])
+
+    def all(self, options=None):
+        options = options or {}
+        client = self._client
+        with client._lock:
+            client.calls["order.all"] += 1
+            items = sorted(
+                (o for o in client.orders.values() if o["created_at"] >= options.get("from", 0)),
+                key=lambda o: o["created_at"],
+                reverse=True,
+            )
+            skip = options.get("skip", 0)
+            page = [dict(o) for o in items[skip:skip + options.get("count", 10)]]
+        return {"entity": "collection", "count": len(page), "items": page}
+
+    def payments(self, order_id):
+        client = self._client
+        with client._lock:
+            client.calls["order.payments"] += 1
+            items = [dict(p) for p in client.payments.values() if p["order_id"] == order_id]
+        return {"entity": "collection", "count": len(items), "items": items}
+
+
+class FakeRazorpayClient:
+    """
+    In-memory stand-in for `razorpay.Client` covering the Orders API.
+
+    `pay(order_id)` captures a payment and returns the webhook Razorpay
+    would send for it as (body, headers), signed with `webhook_secret`;
+    post it to /razorpay/webhook, or drop it to simulate a lost webhook.
+    """
+
+    def __init__(self, webhook_secret: str, latency_ms: float = 0.0):
+        self.webhook_secret = webhook_secret
+        self.latency_ms = latency_ms
+        self.orders = {}
+        self.payments = {}
+        self.calls = {"order.create": 0, "order.fetch": 0, "order.all": 0, "order.payments": 0}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.order = _FakeRazorpayOrders(self)
+
+    def pay(self, order_id):
+        with self._lock:
+            order = self.orders[order_id]
+            order["status"] = "paid"
+            payment = {
+                "id": f"pay_fake{next(self._ids)}",
+                "entity": "payment",
+                "order_id": order_id,
+                "amount": order["amount"],
+                "status": "captured",
+            }
+            self.payments[payment["id"]] = payment
+
+        body = json.dumps({
+            "event": "payment.captured",
+            "payload": {"payment": {"entity": payment}},
+        }).encode()
+        headers = {
+            "content-type": "application/json",
+            "x-razorpay-signature": hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).hexdigest(),
+            "x-razorpay-event-id": f"evt_fake{next(self._ids)}",
+        }
+        return body, headers
@@ -0,0 +1,102 @@
+"""
+Boots the real FastAPI app against the in-memory fakes.
+
+Must be called before anything imports `app.main`, because main.py reads
+its environment and wires MongoDB at import time.
+"""
+
+import asyncio
+import json
+import os
+
+import pymongo
+
+from app.tools.fakes import FakeGraphAPI, FakeMongoClient, FakeRazorpayClient
+
+RAZORPAY_WEBHOOK_SECRET = "offline-razorpay-secret"
+
+
+def boot_offline_app(graph_latency_ms: float = 0.0, razorpay_latency_ms: float = None):
+    """
+    Returns (app.main, FakeGraphAPI). With `razorpay_latency_ms`, seva
+    offerings are enabled against a FakeRazorpayClient, reachable as
+    `app.main.razorpay_client`.
+    """
+    os.environ.setdefault("VERIFY_TOKEN", "offline")
+    os.environ.setdefault("WHATSAPP_TOKEN", "offline")
+    os.environ.setdefault("PHONE_NUMBER_ID", "000000000000000")
+    os.environ.setdefault("MONGODB_URI", "mongodb://offline")
+
+    pymongo.MongoClient = FakeMongoClient
+    graph = FakeGraphAPI(latency_ms=graph_latency_ms).install()
+
+    if razorpay_latency_ms is not None:
+        import razorpay
+
+        os.environ.setdefault("RAZORPAY_KEY_ID", "rzp_test_offline")
+        os.environ.setdefault("RAZORPAY_KEY_SECRET", "offline")
+        os.environ.setdefault("RAZORPAY_WEBHOOK_SECRET", RAZORPAY_WEBHOOK_SECRET)
+        os.environ.setdefault("PUBLIC_BASE_URL", "https://offline.example")
+        fake = FakeRazorpayClient(os.environ["RAZORPAY_WEBHOOK_SECRET"], latency_ms=razorpay_latency_ms)
+        razorpay.Client = lambda *args, **kwargs: fake
+
+    import app.main as main
+    import app.routes.webhook as webhook
+
+    # Captures are unsigned; replays run in development mode.
+    webhook.APP_SECRET = None
+
+    # Upload static media up front so every run sends the same payloads.
+    from app.services.media_service import MEDIA_ASSETS, refresh_media
+    for asset_key in MEDIA_ASSETS:
+        refresh_media(asset_key)
+
+    return main, graph
+
+
+async def asgi_request(app, method: str, path: str, body: bytes = b"", headers: dict = None):
+    """Minimal in-process ASGI client. Returns (status, body_bytes)."""
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    raw_headers.append((b"content-length", str(len(body)).encode()))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": raw_headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("offline", 80),
+    }
+
+    sent = False
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response["body"]
+
+
+async def post_json(app, path: str, data: dict, headers: dict = None):
+    headers = dict(headers or {})
+    headers.setdefault("content-type", "application/json")
+    status, body = await asgi_request(app, "POST", path, json.dumps(data).encode(), headers)
+    return status, body
@@ -0,0 +1,151 @@
+"""
+Accuracy and latency benchmark for the free-text intent matcher.
+
+    python -m app.tools.intent_bench
+    python -m app.tools.intent_bench --samples labeled.jsonl --show-misses
+
+Samples are JSONL lines {"text": ..., "intent": ...}, where intent is a
+menu option id or null for messages that must not match. The bundled set
+(app/tools/intent_samples.jsonl) was written alongside the keyword list,
+so its accuracy is optimistic. The held-out set
+(app/tools/intent_heldout.jsonl) holds misspellings and transliterations
+that were never used to tune the keywords; keep it that way, or it stops
+measuring anything. Label real captured texts (see app.tools.replay) to
+measure against actual traffic.
+
+The exact-string matcher handle_text used before is reported as a
+baseline.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from app.services import intent_service
+from app.services.intent_service import build_index, match_intent
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_samples.jsonl")
+DEFAULT_HELDOUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_heldout.jsonl")
+
+EXACT_BASELINE = {
+    "hi": "greeting", "hello": "greeting", "namaste": "greeting", "start": "greeting",
+    "menu": "menu", "main menu": "menu",
+}
+
+
+def exact_match(text: str):
+    return EXACT_BASELINE.get(text.strip().lower())
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def load_samples(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(matcher, samples):
+    results = [(s["text"], s["intent"], matcher(s["text"])) for s in samples]
+    correct = sum(1 for _, want, got in results if want == got)
+
+    negatives = [r for r in results if r[1] is None]
+    false_positives = sum(1 for _, _, got in negatives if got is not None)
+
+    per_intent = {}
+    for intent in sorted({r[1] for r in results if r[1]}):
+        tp = sum(1 for _, want, got in results if want == intent and got == intent)
+        predicted = sum(1 for _, _, got in results if got == intent)
+        actual = sum(1 for _, want, _ in results if want == intent)
+        per_intent[intent] = (tp / predicted if predicted else 0.0, tp / actual if actual else 0.0, actual)
+
+    misses = [r for r in results if r[1] != r[2]]
+    return correct / len(results), false_positives, len(negatives), per_intent, misses
+
+
+def time_matcher(matcher, samples, repeat, cold=False):
+    """
+    Per-call latency in microseconds, one figure per sample. `cold` clears
+    the typo cache before every call, as for a word never seen before.
+    """
+    clear = intent_service.fuzzy_intent.cache_clear
+    timings = []
+    for sample in samples:
+        text = sample["text"]
+        start = time.perf_counter_ns()
+        for _ in range(repeat):
+            if cold:
+                clear()
+            matcher(text)
+        timings.append((time.perf_counter_ns() - start) / repeat / 1000)
+    return timings
+
+
+def latency_line(label, timings):
+    return (f"  {label:<12} us  p50={percentile(timings, 50):.1f} p99={percentile(timings, 99):.1f} "
+            f"max={max(timings):.1f} mean={sum(timings) / len(timings):.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Intent matcher accuracy and latency")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES, help="labeled JSONL file")
+    parser.add_argument("--heldout", default=DEFAULT_HELDOUT, help="labeled JSONL never used for tuning")
+    parser.add_argument("--repeat", type=int, default=200, help="calls per sample for timing")
+    parser.add_argument("--show-misses", action="store_true")
+    args = parser.parse_args(argv)
+
+    samples = load_samples(args.samples)
+
+    start = time.perf_counter()
+    build_index(intent_service.INTENTS)
+    build_ms = (time.perf_counter() - start) * 1000
+    keywords = sum(len(phrases) for phrases in intent_service.INTENTS.values())
+
+    print(f"Samples: {len(samples)} ({sum(1 for s in samples if s['intent'] is None)} should not match)")
+    print(f"Index:   {keywords} keywords, {len(intent_service._delete_index)} typo variants, "
+          f"built in {build_ms:.1f} ms")
+    print()
+
+    for name, matcher in (("exact (before)", exact_match), ("intent index", match_intent)):
+        accuracy, fp, negatives, per_intent, misses = evaluate(matcher, samples)
+
+        print(f"{name}")
+        print(f"  accuracy {accuracy:.1%}   false matches {fp}/{negatives}")
+
+        if matcher is exact_match:
+            print(latency_line("latency", time_matcher(matcher, samples, args.repeat)))
+        else:
+            print(latency_line("cold", time_matcher(matcher, samples, args.repeat, cold=True)))
+            print(latency_line("cached", time_matcher(matcher, samples, args.repeat)))
+            for intent, (precision, recall, support) in per_intent.items():
+                print(f"  {intent:<12} precision {precision:6.1%}  recall {recall:6.1%}  (n={support})")
+            if args.show_misses:
+                for text, want, got in misses:
+                    print(f"  MISS {text!r}: expected {want}, got {got}")
+        print()
+
+    # Exit status reflects the intent index, the last matcher evaluated.
+    passed = accuracy >= 0.9
+
+    if args.heldout:
+        heldout = load_samples(args.heldout)
+        for name, matcher in (("exact (before)", exact_match), ("intent index", match_intent)):
+            accuracy, fp, negatives, _, misses = evaluate(matcher, heldout)
+            print(f"held-out, {name}")
+            print(f"  accuracy {accuracy:.1%}   false matches {fp}/{negatives}   (n={len(heldout)})")
+            if args.show_misses and matcher is match_intent:
+                for text, want, got in misses:
+                    print(f"  MISS {text!r}: expected {want}, got {got}")
+        print()
+
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
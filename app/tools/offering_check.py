@@ -0,0 +1,126 @@
+"""
+Offline end-to-end check of the seva payment flow.
+
+    python -m app.tools.offering_check --devotees 50 --lost-webhooks 0.3
+    python -m app.tools.offering_check --razorpay-latency-ms 300 --budget 0.2
+
+Boots the app against the in-memory fakes and FakeRazorpayClient. Every
+devotee picks a seva over the WhatsApp webhook and pays the order.
+Razorpay's webhooks are then delivered twice each, except for a
+--lost-webhooks fraction that never arrive, and the reconciler runs.
+
+With a --budget shorter than --razorpay-latency-ms, order creation
+outlives the webhook. Those devotees are told to try again, and each
+late order must still be recorded on its offering.
+
+Passes when every paid order has exactly one booking and one WhatsApp
+confirmation, and no order is left untracked. Exits non-zero otherwise.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+
+from app.tools.harness import asgi_request, boot_offline_app, post_json
+
+
+def seva_selection(phone, seva_id, seq):
+    message = {
+        "from": phone,
+        "id": f"wamid.offering.{phone}.{seq}",
+        "type": "interactive",
+        "interactive": {"type": "list_reply", "list_reply": {"id": f"seva_{seva_id}"}},
+    }
+    return {"entry": [{"changes": [{"value": {"messages": [message]}}]}]}
+
+
+async def run(app, razorpay, devotees, lost_rate, rng):
+    from app.services import offering_service
+
+    seva_ids = list(offering_service.SEVAS)
+    phones = [f"91{9100000000 + i}" for i in range(devotees)]
+
+    await asyncio.gather(*(
+        post_json(app, "/webhook", seva_selection(phone, rng.choice(seva_ids), 0))
+        for phone in phones
+    ))
+
+    # Orders that outlived their webhook are recorded by the pool thread.
+    offering_service._razorpay_executor.shutdown(wait=True)
+
+    lost = 0
+    for order_id in list(razorpay.orders):
+        body, headers = razorpay.pay(order_id)
+        if rng.random() < lost_rate:
+            lost += 1
+            continue
+        for _ in range(2):
+            await asgi_request(app, "POST", "/razorpay/webhook", body, headers)
+
+    offering_service.RECONCILE_MIN_AGE = offering_service.timedelta(0)
+    stats = offering_service.reconcile_pending()
+    return phones, lost, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline seva payment flow check")
+    parser.add_argument("--devotees", type=int, default=50)
+    parser.add_argument("--lost-webhooks", type=float, default=0.3, help="fraction of payment webhooks dropped")
+    parser.add_argument("--razorpay-latency-ms", type=float, default=0.0)
+    parser.add_argument("--budget", type=float, help="request budget in seconds (default REQUEST_BUDGET_SECONDS)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="ERROR", help="app log level during the run")
+    args = parser.parse_args(argv)
+
+    main_module, graph = boot_offline_app(razorpay_latency_ms=args.razorpay_latency_ms)
+    logging.getLogger("TempleBot").setLevel(args.log_level)
+
+    if args.budget is not None:
+        from app.services import resilience_service
+        resilience_service.REQUEST_BUDGET_SECONDS = args.budget
+
+    razorpay = main_module.razorpay_client
+    start = time.perf_counter()
+    phones, lost, stats = asyncio.run(run(main_module.app, razorpay, args.devotees, args.lost_webhooks,
+                                          random.Random(args.seed)))
+    elapsed = time.perf_counter() - start
+
+    offerings = list(main_module.offerings.find({}))
+    by_status = {}
+    for doc in offerings:
+        by_status[doc["status"]] = by_status.get(doc["status"], 0) + 1
+
+    tracked = {doc.get("razorpay_order_id") for doc in offerings}
+    untracked = [order_id for order_id in razorpay.orders if order_id not in tracked]
+    bookings = main_module.bookings.count_documents({})
+    sent = graph.drain()
+    confirmations = sum(
+        1 for item in sent
+        if (item["payload"] or {}).get("type") == "text"
+        and item["payload"]["text"]["body"].startswith("🙏 Payment received")
+    )
+    links = sum(
+        1 for item in sent
+        if (item["payload"] or {}).get("type") == "text" and "/pay/" in item["payload"]["text"]["body"]
+    )
+    paid = len(razorpay.payments)
+
+    print(f"Devotees:      {len(phones)} in {elapsed:.2f}s")
+    print(f"Orders:        {len(razorpay.orders)} created, {len(untracked)} untracked")
+    print(f"Offerings:     {json.dumps(by_status, sort_keys=True)}")
+    print(f"Links sent:    {links}")
+    print(f"Payments:      {paid} ({lost} webhooks lost, the rest delivered twice)")
+    print(f"Reconciler:    {stats}")
+    print(f"Bookings:      {bookings}, confirmations sent: {confirmations}")
+
+    ok = not untracked and bookings == paid and confirmations == paid
+    print("Result:        " + ("PASS" if ok else "FAIL"))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
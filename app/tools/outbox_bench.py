@@ -0,0 +1,96 @@
+"""
+Outbox throughput benchmark against a local stub Graph server.
+
+    python -m app.tools.outbox_bench --messages 5000 --recipients 500
+    python -m app.tools.outbox_bench --fail-rate 0.05 --mongo mongodb://localhost:27017
+
+Enqueues messages spread over recipients, runs the dispatcher until the
+outbox is empty and reports send throughput, enqueue-to-send lag and how
+many messages needed retries. Uses the in-memory Mongo stand-in unless
+--mongo is given (then the throwaway `sohum_outbox_bench` database).
+"""
+
+import argparse
+import sys
+import time
+
+from app.tools.fakes import GraphStubServer
+
+BENCH_DB = "sohum_outbox_bench"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Outbox dispatcher throughput benchmark")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--recipients", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="stub Graph API latency")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of sends answered with 500")
+    parser.add_argument("--mongo", help="MongoDB URI; defaults to the in-memory stand-in")
+    args = parser.parse_args(argv)
+
+    graph = GraphStubServer(latency_ms=args.latency_ms, fail_rate=args.fail_rate).start()
+
+    import app.services.whatsapp_service as whatsapp_service
+    import app.services.outbox_service as outbox_service
+
+    whatsapp_service.GRAPH_URL = f"{graph.base_url}/bench/messages"
+    # Retries should happen within the benchmark, not minutes later.
+    outbox_service.BACKOFF_BASE_SECONDS = 0.05
+    outbox_service.BACKOFF_MAX_SECONDS = 0.5
+
+    if args.mongo:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo, serverSelectionTimeoutMS=5000)
+        client.drop_database(BENCH_DB)
+    else:
+        from app.tools.fakes import FakeMongoClient
+        client = FakeMongoClient()
+
+    db = client[BENCH_DB]
+    outbox = outbox_service.Outbox(db["outbox"], db["outbox_dead_letters"])
+    outbox.ensure_indexes()
+
+    start = time.perf_counter()
+    for i in range(args.messages):
+        outbox.enqueue({
+            "messaging_product": "whatsapp",
+            "to": f"91{9000000000 + i % args.recipients}",
+            "type": "text",
+            "text": {"body": f"bench message {i}"},
+        })
+    enqueue_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    outbox.start()
+    while outbox.counters["sent"] + outbox.counters["dead_lettered"] < args.messages:
+        time.sleep(0.02)
+    drain_s = time.perf_counter() - start
+    outbox.stop()
+    metrics = outbox.metrics()
+    graph.stop()
+
+    lags = [
+        (doc["sent_at"] - doc["created_at"]).total_seconds() * 1000
+        for doc in db["outbox"].find({"status": "sent"}, {"sent_at": 1, "created_at": 1})
+    ]
+
+    print(f"Enqueued {args.messages} in {enqueue_s:.2f}s ({args.messages / enqueue_s:.0f}/s)")
+    print(f"Drained  {args.messages} in {drain_s:.2f}s ({args.messages / drain_s:.0f} sends/s, "
+          f"stub latency {args.latency_ms:.0f} ms, concurrency {outbox_service.OUTBOX_CONCURRENCY})")
+    print(f"Lag ms   p50={percentile(lags, 50):.0f} p90={percentile(lags, 90):.0f} "
+          f"p99={percentile(lags, 99):.0f} max={max(lags) if lags else 0:.0f}")
+    print(f"Stub     delivered={len(graph.sent)} failed={graph.failed}")
+    print(f"Outbox   {metrics}")
+
+    return 0 if len(graph.sent) + metrics["dead_letters"] == args.messages else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Replay a webhook capture against the app, offline.
+
+    python -m app.tools.replay capture.jsonl                  # original timing
+    python -m app.tools.replay capture.jsonl --speed 10       # 10x faster
+    python -m app.tools.replay capture.jsonl --speed max      # no waiting
+    python -m app.tools.replay capture.jsonl --speed max --out run.json
+    python -m app.tools.replay capture.jsonl --speed max --compare run.json
+
+Captures are produced by setting WEBHOOK_CAPTURE_FILE on a running server.
+MongoDB and the Graph API are replaced by in-memory stand-ins, so every
+replay starts from an empty database. Outbound messages are grouped per
+recipient so --compare reports behaviour diffs between two runs.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+
+from app.services.capture_service import read_capture
+from app.tools.harness import boot_offline_app, post_json
+
+
+# =====================================================
+# REPLAY
+# =====================================================
+
+async def replay(app, records, speed):
+    latencies = []
+    statuses = {}
+    tasks = []
+
+    start_wall = time.perf_counter()
+    first_ts = records[0]["ts"] if records else 0
+
+    async def fire(record, due):
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        status, _ = await post_json(app, "/webhook", record["body"], record.get("headers"))
+        # Latency is measured from the scheduled arrival, so time spent
+        # queued behind a blocked event loop is included.
+        latencies.append((time.perf_counter() - max(due, start_wall)) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    for record in records:
+        if speed is None:
+            due = start_wall
+        else:
+            due = start_wall + (record["ts"] - first_ts) / speed
+        tasks.append(asyncio.create_task(fire(record, due)))
+
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start_wall
+    return latencies, statuses, elapsed
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def group_outbound(sent):
+    by_recipient = {}
+    for item in sent:
+        payload = item["payload"] or {}
+        by_recipient.setdefault(payload.get("to", "?"), []).append(payload)
+    return by_recipient
+
+
+def diff_outbound(current, baseline):
+    diffs = []
+    for phone in sorted(set(current) | set(baseline)):
+        ours = current.get(phone, [])
+        theirs = baseline.get(phone, [])
+        if ours == theirs:
+            continue
+        for i in range(max(len(ours), len(theirs))):
+            a = ours[i] if i < len(ours) else None
+            b = theirs[i] if i < len(theirs) else None
+            if a != b:
+                diffs.append({"to": phone, "index": i, "baseline": b, "current": a})
+                break
+    return diffs
+
+
+# =====================================================
+# CLI
+# =====================================================
+
+def parse_speed(value):
+    if value == "max":
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be > 0 or 'max'")
+    return speed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured webhooks offline")
+    parser.add_argument("capture")
+    parser.add_argument("--speed", type=parse_speed, default=1.0,
+                        help="1 = original timing, N = N times faster, 'max' = no delays")
+    parser.add_argument("--graph-latency-ms", type=float, default=0.0,
+                        help="simulated Graph API round-trip per send")
+    parser.add_argument("--razorpay", action="store_true",
+                        help="enable seva offerings against the fake Razorpay client")
+    parser.add_argument("--out", help="write outbound messages per recipient to this file")
+    parser.add_argument("--compare", help="diff outbound messages against a previous --out file")
+    parser.add_argument("--log-level", default="ERROR", help="app log level during the replay")
+    args = parser.parse_args(argv)
+
+    records = list(read_capture(args.capture))
+    if not records:
+        print("Capture is empty.")
+        return 1
+
+    main_module, graph = boot_offline_app(args.graph_latency_ms, 0.0 if args.razorpay else None)
+    logging.getLogger("TempleBot").setLevel(args.log_level)
+
+    latencies, statuses, elapsed = asyncio.run(replay(main_module.app, records, args.speed))
+    outbound = group_outbound(graph.drain())
+
+    print(f"Requests:     {len(records)} in {elapsed:.2f}s ({len(records) / elapsed:.1f} req/s)")
+    print(f"HTTP status:  {statuses}")
+    print(f"Outbound:     {sum(len(v) for v in outbound.values())} messages to {len(outbound)} recipients")
+    print(
+        "Latency ms:   "
+        f"p50={percentile(latencies, 50):.1f} "
+        f"p90={percentile(latencies, 90):.1f} "
+        f"p99={percentile(latencies, 99):.1f} "
+        f"max={max(latencies):.1f} "
+        f"mean={statistics.mean(latencies):.1f}"
+    )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(outbound, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        diffs = diff_outbound(outbound, baseline)
+        if not diffs:
+            print("Behaviour:    identical to baseline")
+        else:
+            print(f"Behaviour:    {len(diffs)} recipient(s) differ from baseline")
+            for d in diffs[:20]:
+                print(json.dumps(d, ensure_ascii=False))
+            return 2
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Multi-worker consistency check: N uvicorn workers, one local mongod.
+
+    python -m app.tools.worker_loadtest --workers 4 --users 200 \\
+        --mongo mongodb://localhost:27017
+
+Starts a stub Graph API server, launches `uvicorn app.main:app` with
+DEPLOYMENT_MODE=multi against a throwaway database (sohum_loadtest, dropped
+first), then drives a full registration conversation for every user
+concurrently. Every message is delivered twice at the same time, as Meta
+does on retries, so the workers race on dedup and on shared session state.
+
+With --outbox, replies go through the durable outbox and the check waits
+for it to drain.
+
+Passes when every user received exactly the expected replies, in order,
+and exactly one devotee record exists per user. Exits non-zero otherwise.
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from pymongo import MongoClient
+
+from app.tools.fakes import GraphStubServer
+
+LOADTEST_DB = "sohum_loadtest"
+APP_SECRET = "loadtest-secret"
+
+# (message to send, replies it must produce)
+CONVERSATION = [
+    ({"interactive": "register"}, ["text:📝 Enter Full Name"]),
+    ({"text": "Load Test User"}, ["text:Enter Gotram"]),
+    ({"text": "Atreya"}, ["text:Enter Address"]),
+    ({"text": "Cheruvugattu"}, ["text:Enter Mobile"]),
+    ({"text": "9000000000"}, ["text:Enter Email"]),
+    ({"text": "no"}, ["text:🎉 Registration Successful", "interactive"]),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# =====================================================
+# DRIVER
+# =====================================================
+
+def webhook_body(phone, seq, message):
+    msg = {"from": phone, "id": f"wamid.lt.{phone}.{seq}", "timestamp": str(int(time.time()))}
+    if "text" in message:
+        msg.update({"type": "text", "text": {"body": message["text"]}})
+    else:
+        msg.update({"type": "interactive",
+                    "interactive": {"type": "list_reply", "list_reply": {"id": message["interactive"]}}})
+    return json.dumps({"entry": [{"changes": [{"value": {"messages": [msg]}}]}]}).encode()
+
+
+def post_signed(url, body):
+    signature = "sha256=" + hmac.new(APP_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return requests.post(url, data=body, timeout=30, headers={
+        "Content-Type": "application/json",
+        "X-Hub-Signature-256": signature,
+    })
+
+
+def run_user(url, phone, duplicates):
+    with ThreadPoolExecutor(max_workers=duplicates) as pool:
+        for seq, (message, _) in enumerate(CONVERSATION):
+            body = webhook_body(phone, seq, message)
+            # Same message delivered concurrently; exactly one must be processed.
+            list(pool.map(lambda _: post_signed(url, body), range(duplicates)))
+
+
+def describe(payload):
+    if payload.get("type") == "text":
+        return "text:" + payload["text"]["body"]
+    return payload.get("type", "?")
+
+
+def check(users, sent):
+    by_phone = {}
+    for payload in sent:
+        by_phone.setdefault(payload.get("to"), []).append(describe(payload))
+
+    expected = [reply for _, replies in CONVERSATION for reply in replies]
+    lost, duplicated, wrong = [], [], []
+
+    for phone in users:
+        got = by_phone.get(phone, [])
+        if len(got) < len(expected):
+            lost.append(phone)
+        elif len(got) > len(expected):
+            duplicated.append(phone)
+        elif not all(g.startswith(e) for g, e in zip(got, expected)):
+            wrong.append(phone)
+
+    return lost, duplicated, wrong
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-worker lost/duplicate reply check")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duplicates", type=int, default=2, help="copies of each inbound message")
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--outbox", action="store_true", help="send replies through the durable outbox")
+    args = parser.parse_args(argv)
+
+    mongo = MongoClient(args.mongo, serverSelectionTimeoutMS=5000)
+    mongo.drop_database(LOADTEST_DB)
+
+    graph = GraphStubServer().start()
+    app_port = free_port()
+
+    env = dict(
+        os.environ,
+        VERIFY_TOKEN="loadtest",
+        WHATSAPP_TOKEN="loadtest",
+        PHONE_NUMBER_ID="loadtest",
+        MONGODB_URI=args.mongo,
+        MONGODB_DB=LOADTEST_DB,
+        APP_SECRET=APP_SECRET,
+        DEPLOYMENT_MODE="multi",
+        GRAPH_API_BASE=graph.base_url,
+        OUTBOX_ENABLED="true" if args.outbox else "false",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--port", str(app_port), "--workers", str(args.workers), "--log-level", "warning"],
+        env=env,
+    )
+
+    base = f"http://127.0.0.1:{app_port}"
+    try:
+        for _ in range(100):
+            try:
+                if requests.get(f"{base}/health", timeout=1).ok:
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        else:
+            print("Server did not start")
+            return 1
+
+        users = [f"91{8000000000 + i}" for i in range(args.users)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(lambda p: run_user(f"{base}/webhook", p, args.duplicates), users))
+        elapsed = time.perf_counter() - start
+
+        # With the outbox, replies leave asynchronously; give it time to drain.
+        expected = args.users * sum(len(replies) for _, replies in CONVERSATION)
+        deadline = time.time() + 60
+        while args.outbox and len(graph.sent) < expected and time.time() < deadline:
+            time.sleep(0.5)
+
+        inbound = args.users * len(CONVERSATION) * args.duplicates
+        lost, duplicated, wrong = check(users, graph.sent)
+        devotees = mongo[LOADTEST_DB]["devotees"].count_documents({})
+
+        print(f"Workers: {args.workers}  users: {args.users}  inbound: {inbound} "
+              f"in {elapsed:.1f}s ({inbound / elapsed:.0f} req/s)")
+        print(f"Replies: {len(graph.sent)}  devotees: {devotees}")
+        print(f"Lost: {len(lost)}  duplicated: {len(duplicated)}  out of order: {len(wrong)}")
+
+        ok = not lost and not duplicated and not wrong and devotees == args.users
+        print("PASS" if ok else "FAIL")
+        return 0 if ok else 1
+
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        graph.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.tools.fakes import FakeMongoClient  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """A fresh in-memory database per test."""
+    return FakeMongoClient()["test"]
+
+
+@pytest.fixture(scope="session")
+def offline_app():
+    """The real app wired to the fakes; main.py only imports once per run."""
+    from app.tools.harness import boot_offline_app
+
+    main, graph = boot_offline_app(razorpay_latency_ms=0)
+    return main, graph
+
+
+@pytest.fixture
+def graph_stub(monkeypatch):
+    """A GraphStubServer wired in as the Graph API, with a closed breaker."""
+    import requests
+
+    from app.services import whatsapp_service
+    from app.services.resilience_service import graph_breaker
+    from app.tools.fakes import GraphStubServer
+
+    stub = GraphStubServer().start()
+    # offline_app swaps requests.post for FakeGraphAPI; go over the socket.
+    monkeypatch.setattr(requests, "post", requests.api.post)
+    monkeypatch.setattr(whatsapp_service, "GRAPH_URL", f"{stub.base_url}/test/messages")
+    monkeypatch.setattr(whatsapp_service, "MEDIA_URL", f"{stub.base_url}/test/media")
+    monkeypatch.setattr(graph_breaker, "failure_threshold", 10 ** 6)
+    graph_breaker.record_success()
+    yield stub
+    stub.stop()
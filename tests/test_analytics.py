@@ -0,0 +1,87 @@
+import pytest
+from pymongo.errors import AutoReconnect
+
+from app.services import analytics_service
+
+
+@pytest.fixture
+def analytics(db, monkeypatch):
+    monkeypatch.setattr(analytics_service, "ANALYTICS_ENABLED", True)
+    monkeypatch.setattr(analytics_service, "_pending", {})
+    monkeypatch.setattr(analytics_service, "_pending_max", {})
+    monkeypatch.setattr(analytics_service, "_pending_users", set())
+    monkeypatch.setattr(analytics_service, "_retry", [])
+    for name in ("daily", "active_users", "sessions"):
+        monkeypatch.setattr(analytics_service, name, None)
+    analytics_service.init_analytics(db["analytics_daily"], db["analytics_active_users"], db["sessions"])
+    return db
+
+
+def _today(db):
+    return db["analytics_daily"].find_one({"_id": analytics_service.day_key()})
+
+
+def _fail_bulk_write(db, monkeypatch, after_applying):
+    collection = db["analytics_daily"]
+    real = collection.bulk_write
+    calls = []
+
+    def flaky(ops, ordered=True):
+        calls.append(len(ops))
+        if len(calls) == 1:
+            if after_applying:
+                real(ops, ordered=ordered)
+            raise AutoReconnect("connection reset")
+        return real(ops, ordered=ordered)
+
+    monkeypatch.setattr(collection, "bulk_write", flaky)
+    return calls
+
+
+@pytest.mark.parametrize("after_applying", [False, True])
+def test_failed_flush_is_retried_without_double_counting(analytics, monkeypatch, after_applying):
+    calls = _fail_bulk_write(analytics, monkeypatch, after_applying)
+    for _ in range(3):
+        analytics_service.record_message("911111111111", "text", "history", 120)
+
+    analytics_service.flush()
+    analytics_service.flush()
+
+    assert len(calls) == 2
+    doc = _today(analytics)
+    assert doc["messages"]["total"] == 3
+    assert doc["options"]["history"] == 3
+    assert doc["latency"]["count"] == 3
+    assert doc["active_users"] == 1
+
+
+def test_retry_waits_behind_new_counts(analytics, monkeypatch):
+    _fail_bulk_write(analytics, monkeypatch, after_applying=False)
+    analytics_service.record_message("911111111111", "text")
+    analytics_service.flush()
+
+    analytics_service.record_message("912222222222", "text")
+    analytics_service.flush()
+
+    doc = _today(analytics)
+    assert doc["messages"]["total"] == 2
+    assert doc["active_users"] == 2
+
+
+def test_language_split_follows_the_session(analytics):
+    sessions = analytics["sessions"]
+    sessions.insert_one({"phone": "911111111111", "language": "tel"})
+    sessions.insert_one({"phone": "912222222222"})
+
+    analytics_service.record_message("911111111111", "text")
+    analytics_service.record_message("912222222222", "interactive", "lang_en")
+    analytics_service.flush()
+    assert _today(analytics)["languages"] == {"en": 1, "tel": 1}
+
+    sessions.update_one({"phone": "911111111111"}, {"$set": {"language": "en"}})
+    analytics_service.record_message("911111111111", "text")
+    analytics_service.flush()
+
+    doc = _today(analytics)
+    assert doc["languages"] == {"en": 2, "tel": 0}
+    assert doc["active_users"] == 2
@@ -0,0 +1,87 @@
+from app.services import capture_service
+
+
+def _payload(message, **value):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "1234",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "metadata": {"display_phone_number": "15550001111"},
+                    "contacts": [{"wa_id": "919876543210", "profile": {"name": "Ravi"}}],
+                    "messages": [message],
+                    **value,
+                },
+            }],
+        }],
+    }
+
+
+def _message(data):
+    return data["entry"][0]["changes"][0]["value"]["messages"][0]
+
+
+def test_location_and_context_are_dropped():
+    data = _payload({
+        "from": "919876543210", "id": "wamid.ABC", "timestamp": "1", "type": "location",
+        "location": {"latitude": 17.4, "longitude": 78.5, "address": "Home"},
+        "context": {"from": "15550001111", "id": "wamid.PREV"},
+    })
+
+    message = _message(capture_service.scrub_payload(data))
+
+    assert message["type"] == "location"
+    assert "location" not in message and "context" not in message
+    assert message["from"] != "919876543210"
+    assert "ABC" not in message["id"]
+
+
+def test_image_caption_and_contacts_are_dropped():
+    data = _payload({
+        "from": "919876543210", "id": "wamid.A", "type": "image",
+        "image": {"id": "m1", "caption": "my address is ..."},
+    })
+
+    scrubbed = capture_service.scrub_payload(data)
+    value = scrubbed["entry"][0]["changes"][0]["value"]
+
+    assert set(_message(scrubbed)) == {"type", "from", "id"}
+    assert value["contacts"] == [{"wa_id": capture_service.pseudonymize_phone("919876543210")}]
+    assert "metadata" not in value
+
+
+def test_interactive_keeps_only_option_id():
+    data = _payload({
+        "from": "919876543210", "id": "wamid.B", "type": "interactive",
+        "interactive": {"type": "list_reply", "list_reply": {"id": "opt_timings", "title": "Timings"}},
+    })
+
+    assert _message(capture_service.scrub_payload(data))["interactive"] == {
+        "type": "list_reply", "list_reply": {"id": "opt_timings"},
+    }
+
+
+def test_pseudonyms_are_stable_within_a_capture():
+    assert capture_service.pseudonymize_phone("919876543210") == capture_service.pseudonymize_phone("919876543210")
+    assert capture_service.pseudonymize_id("wamid.X") == capture_service.pseudonymize_id("wamid.X")
+
+
+def test_capture_is_written_by_background_thread(tmp_path, monkeypatch):
+    path = tmp_path / "capture.jsonl"
+    monkeypatch.setattr(capture_service, "CAPTURE_FILE", str(path))
+
+    data = _payload({"from": "919876543210", "id": "wamid.C", "type": "text", "text": {"body": "menu"}})
+    capture_service.capture_request({"content-type": "application/json"}, data)
+    capture_service.flush_capture()
+
+    records = list(capture_service.read_capture(str(path)))
+    assert len(records) == 1
+    assert _message(records[0]["body"])["text"] == {"body": "menu"}
+
+
+def test_text_is_kept_only_when_it_routes_to_an_intent():
+    assert capture_service.scrub_text("when is the next amavasya") == "when is the next amavasya"
+    assert capture_service.scrub_text("Ravi Kumar") == "<redacted:10>"
+    assert capture_service.scrub_text("admin menu") == "<redacted:10>"
@@ -0,0 +1,51 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from app.services import credential_service as cs
+
+
+@pytest.fixture(autouse=True)
+def cheap_cost(monkeypatch):
+    monkeypatch.setattr(cs, "SCRYPT_N", 1024)
+    monkeypatch.setattr(cs, "SCRYPT_R", 8)
+    monkeypatch.setattr(cs, "SCRYPT_P", 1)
+
+
+def params(stored_hash):
+    _, n, r, p, _, _ = stored_hash.split("$")
+    return int(n), int(r), int(p)
+
+
+def test_current_hash_needs_no_rehash():
+    stored = cs.hash_key_sync("secret")
+    assert cs.verify_key_sync("secret", stored) == (True, False)
+    assert cs.verify_key_sync("wrong", stored) == (False, False)
+
+
+def test_legacy_sha256_is_rehashed():
+    legacy = hashlib.sha256(b"secret").hexdigest()
+    assert cs.verify_key_sync("secret", legacy) == (True, True)
+
+
+def test_weaker_hash_is_rehashed():
+    stored = cs.hash_key_sync("secret", n=512)
+    assert cs.verify_key_sync("secret", stored) == (True, True)
+
+
+def test_stronger_hash_is_not_downgraded():
+    stored = cs.hash_key_sync("secret", n=2048)
+    assert cs.verify_key_sync("secret", stored) == (True, False)
+
+
+def test_upgrade_keeps_the_stronger_parameter(db):
+    stored = cs.hash_key_sync("secret", n=2048, r=4)
+    db["admins"].insert_one({"phone": "91999", "personal_key_hash": stored})
+    admin = db["admins"].find_one({"phone": "91999"})
+
+    assert asyncio.run(cs.verify_and_upgrade("91999", "secret", admin, db["admins"]))
+
+    upgraded = db["admins"].find_one({"phone": "91999"})["personal_key_hash"]
+    assert params(upgraded) == (2048, 8, 1)
+    assert cs.verify_key_sync("secret", upgraded) == (True, False)
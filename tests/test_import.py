@@ -0,0 +1,63 @@
+import io
+
+import pytest
+
+from app.services import import_service
+
+
+def _row(phone, **extra):
+    return {"Name": "Ravi Kumar", "Address": "Hyderabad", "Mobile": "9876543210", "WhatsApp": phone, **extra}
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("9876543210", "919876543210"),
+    ("98765 43210", "919876543210"),
+    ("09876543210", "919876543210"),
+    ("0 98765-43210", "919876543210"),
+    ("9198765432", "919198765432"),          # 10 digits starting with 91 is still local
+    ("919876543210", "919876543210"),
+    ("+91 98765 43210", "919876543210"),
+    ("+1 (415) 555-0100", "14155550100"),    # foreign code kept, no 91 added
+    ("+44 7911 123456", "447911123456"),
+])
+def test_phone_rules(raw, expected):
+    assert import_service.to_devotee(_row(raw))["phone"] == expected
+
+
+@pytest.mark.parametrize("raw", [
+    "98765432",              # too short
+    "009876543210",          # only one trunk 0 is stripped
+    "14155550100",           # 11 digits without "+": ambiguous
+    "929876543210",          # 12 digits, not Indian, no "+"
+    "+91 98765+43210",       # stray "+"
+    "+1234567",              # shorter than any E.164 number
+    "phone",
+])
+def test_ambiguous_phones_are_rejected(raw):
+    with pytest.raises(ValueError, match="invalid phone"):
+        import_service.to_devotee(_row(raw))
+
+
+def test_mobile_is_used_when_whatsapp_column_is_missing():
+    row = {"full_name": "Sita", "ADDRESS ": "Vijayawada", "mobile_number": "09000000001"}
+    record = import_service.to_devotee(row)
+    assert record["phone"] == "919000000001"
+    assert record["address"] == "Vijayawada"
+
+
+def test_import_reports_bad_rows_and_upserts_good_ones(db, tmp_path):
+    path = tmp_path / "register.csv"
+    path.write_text(
+        "name,address,mobile,whatsapp\n"
+        "Ravi,Hyderabad,9876543210,+91 98765 43210\n"
+        "Sita,Vijayawada,12345,\n"
+        "Ravi K,Hyderabad,9876543210,09876543210\n",
+        encoding="utf-8",
+    )
+    errors = io.StringIO()
+
+    stats = import_service.import_devotees(db["devotees"], str(path), errors_out=errors)
+
+    assert stats["invalid"] == 1 and stats["merged"] == 1 and stats["inserted"] == 1
+    assert '"row": 3' in errors.getvalue()
+    assert db["devotees"].find_one({"phone": "919876543210"})["full_name"] == "Ravi K"
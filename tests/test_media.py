@@ -0,0 +1,72 @@
+import pytest
+import requests
+
+from app.services import media_service, whatsapp_service
+from app.tools.fakes import FakeResponse
+
+PHONE = "919876543210"
+
+
+@pytest.fixture
+def media(db, graph_stub, monkeypatch):
+    def download(url, **kwargs):
+        response = FakeResponse(200, {})
+        response.content = b"\x89PNG test asset"
+        response.raise_for_status = lambda: None
+        return response
+
+    monkeypatch.setattr(requests, "get", download)
+    monkeypatch.setattr(media_service, "_local", {})
+    monkeypatch.setattr(whatsapp_service, "outbox", None)
+    monkeypatch.setattr(whatsapp_service, "media_failure_handler", None)
+    media_service.init_media(db["media_cache"], db["locks"])
+    return graph_stub
+
+
+def _wait_for_uploads():
+    media_service._uploader.submit(lambda: None).result(timeout=10)
+
+
+def test_rejected_id_falls_back_to_link_and_reuploads(media, db):
+    first_id = media_service.refresh_media("history_en")
+    assert [u["id"] for u in media.uploads] == [first_id]
+
+    media_service.send_cached_image(PHONE, "history_en", "History")
+    assert media.sent[-1]["image"] == {"id": first_id, "caption": "History"}
+
+    # Meta forgets the id (expired early): it answers 400 / 131053.
+    media.media_ids.clear()
+    media_service.send_cached_image(PHONE, "history_en", "History")
+    _wait_for_uploads()
+
+    assert media.rejected == 1
+    assert media.sent[-1]["image"] == {"link": media_service.MEDIA_ASSETS["history_en"][0], "caption": "History"}
+    assert len(media.uploads) == 2
+
+    second_id = media.uploads[-1]["id"]
+    assert second_id != first_id
+    assert db["media_cache"].find_one({"asset_key": "history_en"})["media_id"] == second_id
+
+    media_service.send_cached_image(PHONE, "history_en", "History")
+    assert media.sent[-1]["image"]["id"] == second_id
+    assert media.rejected == 1
+
+
+def test_link_is_used_until_the_first_upload(media):
+    media_service.send_cached_image(PHONE, "history_tel", "History")
+    _wait_for_uploads()
+
+    assert "link" in media.sent[0]["image"]
+    assert len(media.uploads) == 1
+
+
+def test_image_sends_are_timed_as_stages(media):
+    from app.services.profiling_service import begin_trace, end_trace
+
+    trace = begin_trace()
+    try:
+        whatsapp_service.send_image_by_id(PHONE, "never-issued", "History", fallback_link="https://example.org/h.png")
+    finally:
+        end_trace(trace)
+
+    assert [name for name, _ in trace.stages] == ["send:image", "send:image"]
@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from app.routes import admin
+from app.tools.harness import asgi_request
+
+PATHS = ["/metrics/resilience", "/metrics/traffic", "/metrics/outbox"]
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_metrics_need_admin_key(offline_app, monkeypatch, path):
+    main, _ = offline_app
+    monkeypatch.setattr(admin, "ADMIN_API_KEY", "s3cret")
+
+    status, _ = asyncio.run(asgi_request(main.app, "GET", path))
+    assert status == 403
+
+    status, _ = asyncio.run(asgi_request(main.app, "GET", path, headers={"X-Admin-Key": "wrong"}))
+    assert status == 403
+
+    status, _ = asyncio.run(asgi_request(main.app, "GET", path, headers={"X-Admin-Key": "s3cret"}))
+    assert status == 200
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_metrics_hidden_without_admin_key(offline_app, monkeypatch, path):
+    main, _ = offline_app
+    monkeypatch.setattr(admin, "ADMIN_API_KEY", None)
+
+    status, _ = asyncio.run(asgi_request(main.app, "GET", path))
+    assert status == 404
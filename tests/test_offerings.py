@@ -0,0 +1,88 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import offering_service
+from app.tools.fakes import FakeRazorpayClient
+
+PHONE = "919876543210"
+
+
+@pytest.fixture
+def razorpay(db, monkeypatch):
+    client = FakeRazorpayClient("test-secret")
+    offering_service.init_offerings(client, db["offerings"], db["bookings"], db["payment_events"])
+    texts = []
+    monkeypatch.setattr(offering_service, "send_text", lambda phone, body: texts.append((phone, body)))
+    client.texts = texts
+    return client
+
+
+def _offering():
+    seva_id = next(iter(offering_service.SEVAS))
+    offering = asyncio.run(offering_service.create_offering(PHONE, seva_id))
+    # Old enough for the reconciler to look at.
+    offering_service.offerings.update_one(
+        {"offering_id": offering["offering_id"]},
+        {"$set": {"created_at": datetime.utcnow() - timedelta(minutes=10)}},
+    )
+    return offering
+
+
+def _status(offering):
+    return offering_service.offerings.find_one({"offering_id": offering["offering_id"]})["status"]
+
+
+def test_webhook_retries_and_reconciler_book_once(razorpay):
+    offering = _offering()
+    body, headers = razorpay.pay(offering["razorpay_order_id"])
+    event = json.loads(body)
+
+    assert offering_service.handle_payment_event("evt_1", event) == "paid"
+    assert offering_service.handle_payment_event("evt_1", event) == "duplicate"
+    offering_service.handle_payment_event("evt_2", event)
+    offering_service.reconcile_pending()
+
+    assert _status(offering) == "paid"
+    assert offering_service.bookings.count_documents({"offering_id": offering["offering_id"]}) == 1
+    assert len(razorpay.texts) == 1
+
+
+def test_reconciler_catches_a_lost_webhook(razorpay):
+    offering = _offering()
+    razorpay.pay(offering["razorpay_order_id"])
+
+    stats = offering_service.reconcile_pending()
+
+    assert stats["paid"] == 1
+    assert _status(offering) == "paid"
+    assert len(razorpay.texts) == 1
+
+
+def test_booking_without_status_flip_is_completed_not_rebooked(razorpay):
+    offering = _offering()
+    offering_service.bookings.insert_one({"booking_id": "BKX", "offering_id": offering["offering_id"],
+                                          "created_at": datetime.utcnow()})
+
+    assert not offering_service.mark_paid(offering["razorpay_order_id"], "pay_1", "webhook")
+    assert _status(offering) == "paid"
+    assert razorpay.texts == []
+
+
+def test_reconciler_repairs_booked_offering_left_unpaid(razorpay):
+    offering = _offering()
+    offering_service.offerings.update_one({"offering_id": offering["offering_id"]}, {"$set": {"status": "expired"}})
+    offering_service.bookings.insert_one({"booking_id": "BKX", "offering_id": offering["offering_id"],
+                                          "created_at": datetime.utcnow()})
+
+    stats = offering_service.reconcile_pending()
+
+    assert stats["repaired"] == 1
+    assert _status(offering) == "paid"
+
+
+def test_unknown_order_is_not_booked(razorpay):
+    assert not offering_service.mark_paid("order_missing", "pay_1", "webhook")
+    assert offering_service.bookings.count_documents({}) == 0
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+from app.services import coordination, outbox_service, whatsapp_service
+from app.services.outbox_service import Outbox
+from app.tools.fakes import GraphStubServer
+
+
+@pytest.fixture
+def outbox(db, monkeypatch):
+    # Retries are due at once so a test can drain the queue in a loop.
+    monkeypatch.setattr(outbox_service, "backoff_seconds", lambda attempts: 0)
+    outbox = Outbox(db["outbox"], db["outbox_dead_letters"])
+    outbox.ensure_indexes()
+    yield outbox
+    outbox.stop()
+
+
+def _text(to, body):
+    return {"messaging_product": "whatsapp", "to": to, "type": "text", "text": {"body": body}}
+
+
+def _drain(outbox, rounds=500):
+    for _ in range(rounds):
+        if not outbox.dispatch_once() and not outbox.outbox.count_documents({"status": {"$ne": "sent"}}):
+            return
+    raise AssertionError("outbox did not drain")
+
+
+def test_each_recipient_has_one_head(outbox):
+    for i in range(3):
+        outbox.enqueue(_text("911111111111", f"a{i}"))
+        outbox.enqueue(_text("912222222222", f"b{i}"))
+
+    heads = list(outbox.outbox.find({"head": True}))
+    assert sorted(h["payload"]["text"]["body"] for h in heads) == ["a0", "b0"]
+
+
+def test_backlog_does_not_starve_other_recipients(outbox):
+    for i in range(100):
+        outbox.enqueue(_text("911111111111", f"flood {i}"))
+    outbox.enqueue(_text("912222222222", "hello"))
+
+    claimed = outbox.claim_batch(limit=10)
+
+    assert sorted(doc["to"] for doc in claimed) == ["911111111111", "912222222222"]
+
+
+def test_order_is_kept_per_recipient_through_failures(outbox, graph_stub, monkeypatch):
+    flaky = GraphStubServer(fail_rate=0.3, seed=7).start()
+    monkeypatch.setattr(whatsapp_service, "GRAPH_URL", f"{flaky.base_url}/test/messages")
+
+    recipients = [f"91900000{n:04d}" for n in range(20)]
+    expected = {to: [f"{to}-{i}" for i in range(5)] for to in recipients}
+    # Interleave recipients while keeping each one's own order.
+    random.Random(1).shuffle(recipients)
+    for i in range(5):
+        for to in recipients:
+            outbox.enqueue(_text(to, expected[to][i]))
+
+    try:
+        _drain(outbox)
+    finally:
+        flaky.stop()
+
+    assert flaky.failed > 0
+    received = {}
+    for payload in flaky.sent:
+        received.setdefault(payload["to"], []).append(payload["text"]["body"])
+    assert received == expected
+    assert len(flaky.sent) == 100
+
+
+def test_dead_letter_promotes_the_next_message(outbox, graph_stub):
+    to = "913333333333"
+    outbox.enqueue({"messaging_product": "whatsapp", "to": to, "type": "image", "image": {"id": "never-issued"}})
+    outbox.enqueue(_text(to, "after the bad image"))
+
+    _drain(outbox)
+
+    assert outbox.dead_letters.count_documents({"to": to}) == 1
+    assert [p["text"]["body"] for p in graph_stub.sent] == ["after the bad image"]
+
+
+def test_multi_worker_queues_behind_another_workers_deferral(outbox, monkeypatch):
+    monkeypatch.setattr(whatsapp_service, "outbox", outbox)
+    monkeypatch.setattr(whatsapp_service, "outbox_all", False)
+    monkeypatch.setattr(whatsapp_service, "_deferred", {})
+    monkeypatch.setattr(coordination, "DEPLOYMENT_MODE", "multi")
+
+    # Deferred by some other worker: only the shared outbox knows.
+    outbox.enqueue(_text("911111111111", "first"))
+
+    assert whatsapp_service._should_queue("911111111111")
+    assert not whatsapp_service._should_queue("912222222222")
+
+    monkeypatch.setattr(coordination, "DEPLOYMENT_MODE", "single")
+    assert not whatsapp_service._should_queue("911111111111")
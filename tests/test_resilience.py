@@ -0,0 +1,82 @@
+import pytest
+import requests
+
+from app.services import resilience_service, whatsapp_service
+from app.services.outbox_service import Outbox
+from app.services.resilience_service import CircuitBreaker, begin_budget, end_budget, mongo_timeout
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    fresh = CircuitBreaker("graph_api", failure_threshold=5, open_seconds=30)
+    monkeypatch.setattr(whatsapp_service, "graph_breaker", fresh)
+    return fresh
+
+
+@pytest.fixture
+def budget():
+    yield begin_budget
+    end_budget()
+
+
+class _Raising:
+    def __init__(self, error):
+        self.error = error
+
+    def post(self, *args, **kwargs):
+        raise self.error
+
+
+def test_mongo_timeout_is_capped_by_the_budget(budget, monkeypatch):
+    monkeypatch.setattr(resilience_service, "MONGO_TIMEOUT_MS", 2000)
+    assert mongo_timeout() == 2.0
+
+    budget(8)
+    assert mongo_timeout() == 2.0
+
+    budget(1)
+    assert 0.5 <= mongo_timeout() <= 1.0
+
+    # An exhausted budget still leaves a short, non-zero timeout.
+    budget(0)
+    assert mongo_timeout() == resilience_service.MIN_CALL_TIMEOUT
+
+
+def test_budgeted_collection_passes_calls_through(db):
+    collection = resilience_service.BudgetedDatabase(db)["things"]
+    collection.insert_one({"_id": 1, "n": 1})
+    collection.update_one({"_id": 1}, {"$inc": {"n": 1}})
+    assert collection.find_one({"_id": 1})["n"] == 2
+
+
+def test_budget_cut_timeout_does_not_count_against_meta(breaker, budget):
+    budget(1)
+    with pytest.raises(requests.ReadTimeout):
+        whatsapp_service.deliver({"to": "91"}, http=_Raising(requests.ReadTimeout()))
+    assert breaker.failures == 0
+
+
+def test_full_length_timeout_counts_against_meta(breaker):
+    with pytest.raises(requests.ReadTimeout):
+        whatsapp_service.deliver({"to": "91"}, http=_Raising(requests.ReadTimeout()))
+    assert breaker.failures == 1
+
+
+def test_read_timeout_is_not_requeued(db, breaker, monkeypatch):
+    outbox = Outbox(db["outbox"], db["outbox_dead_letters"])
+    monkeypatch.setattr(whatsapp_service, "outbox", outbox)
+    monkeypatch.setattr(whatsapp_service, "_deferred", {})
+
+    def failing(error):
+        def deliver(payload):
+            raise error
+        monkeypatch.setattr(whatsapp_service, "deliver", deliver)
+
+    failing(requests.ReadTimeout())
+    with pytest.raises(requests.ReadTimeout):
+        whatsapp_service._deliver_or_defer({"to": "911111111111", "type": "text"})
+    assert outbox.outbox.count_documents({}) == 0
+
+    failing(requests.ConnectionError())
+    whatsapp_service._deliver_or_defer({"to": "911111111111", "type": "text"})
+    assert outbox.outbox.count_documents({"to": "911111111111"}) == 1
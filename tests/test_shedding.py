@@ -0,0 +1,75 @@
+import asyncio
+import itertools
+
+import pytest
+
+from app.services import traffic_service
+from app.tools.harness import post_json
+
+_ids = itertools.count(1)
+
+
+def _webhook(sender, message):
+    message = {"from": sender, "id": f"wamid.shed.{next(_ids)}", "timestamp": "1", **message}
+    return {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {"messages": [message]}}]}]}
+
+
+def _text(sender, body):
+    return _webhook(sender, {"type": "text", "text": {"body": body}})
+
+
+def _choice(sender, option):
+    return _webhook(sender, {"type": "interactive", "interactive": {"type": "list_reply", "list_reply": {"id": option}}})
+
+
+@pytest.fixture
+def shedding(offline_app, monkeypatch):
+    main, graph = offline_app
+    monkeypatch.setattr(traffic_service.load_monitor, "shedding", True)
+    monkeypatch.setattr(traffic_service.load_monitor, "_told", set())
+    graph.drain()
+    return main, graph
+
+
+def _post(main, data):
+    status, _ = asyncio.run(post_json(main.app, "/webhook", data))
+    return status
+
+
+def test_shed_message_is_refused_for_redelivery(shedding):
+    main, graph = shedding
+    data = _choice("919000000101", "history")
+
+    assert _post(main, data) == 503
+    assert _post(main, _choice("919000000101", "register")) == 503
+    assert [p["payload"]["text"]["body"] for p in graph.drain()] == [traffic_service.BUSY_TEXT]
+
+    # Not marked as processed, so Meta's redelivery is handled once shedding ends.
+    assert main.processed_messages.find_one({"message_id": data["entry"][0]["changes"][0]["value"]["messages"][0]["id"]}) is None
+
+
+def test_greeting_gets_the_static_menu(shedding, monkeypatch):
+    main, graph = shedding
+    # The static menu must not read the session.
+    monkeypatch.setattr(main, "sessions", None)
+
+    assert _post(main, _text("919000000102", "hi")) == 200
+
+    sent = graph.drain()
+    assert len(sent) == 1 and sent[0]["payload"]["type"] == "interactive"
+
+
+def test_free_text_routed_to_a_cheap_option_is_served(shedding):
+    main, graph = shedding
+
+    assert _post(main, _text("919000000103", "when is the next tithi")) == 200
+    assert _post(main, _choice("919000000104", "next_tithi")) == 200
+
+    bodies = [p["payload"].get("text", {}).get("body", "") for p in graph.drain()]
+    assert traffic_service.BUSY_TEXT not in bodies
+    assert bodies
+
+
+def test_admin_login_is_never_routed_while_shedding(shedding):
+    main, _ = shedding
+    assert _post(main, _text("919000000105", "admin menu")) == 503